@@ -0,0 +1,73 @@
+"""
+Per-process cache of live python-chess boards
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+
+class BoardCache:
+    """
+    Bounded LRU cache of chess.Board objects keyed by game uuid
+
+    Every entry remembers the Board.version it was built from. Looking up a board
+    with any other version is a miss and drops the entry, so a worker never serves
+    a board that another worker has moved on from.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._boards = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._boards)
+
+    def get(self, game_uuid, version):
+        """
+        Return a copy of the cached board, or None if it is missing or stale
+        """
+
+        key = str(game_uuid)
+
+        with self._lock:
+            entry = self._boards.get(key)
+
+            if entry is None:
+                return None
+
+            cached_version, chess_board = entry
+
+            if cached_version != version:
+                del self._boards[key]
+                return None
+
+            self._boards.move_to_end(key)
+
+            return chess_board.copy()
+
+    def set(self, game_uuid, version, chess_board):
+        if self.maxsize <= 0:
+            return
+
+        key = str(game_uuid)
+
+        with self._lock:
+            self._boards[key] = (version, chess_board.copy())
+            self._boards.move_to_end(key)
+
+            while len(self._boards) > self.maxsize:
+                self._boards.popitem(last=False)
+
+    def discard(self, game_uuid):
+        with self._lock:
+            self._boards.pop(str(game_uuid), None)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+board_cache = BoardCache(settings.BOARD_CACHE_SIZE)
@@ -1 +1,10 @@
 K_FACTOR = 32
+
+# Opening explorer statistics only cover the first EXPLORER_MAX_PLY half moves of a game
+EXPLORER_MAX_PLY = 50
+
+# Most players listed by /api/elo/leaderboard/
+LEADERBOARD_SIZE = 100
+
+# Glicko-2 constraint on how much volatility changes from one rating period to the next
+GLICKO_TAU = 0.5
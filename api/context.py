@@ -0,0 +1,53 @@
+"""
+Game data shared by the permission checks and the actions of a single request
+"""
+
+import chess
+
+from . import services
+
+
+class GameContext:
+    """
+    A game loaded once per request, with its players' ids and the parsed
+    python-chess Board (only parsed when first needed)
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.white_player_id = game.white_player_id
+        self.black_player_id = game.black_player_id
+        self._chess_board = None
+
+    @property
+    def board(self):
+        return self.game.board
+
+    @property
+    def chess_board(self):
+        if self._chess_board is None:
+            self._chess_board = services.chess_board_from_board(self.game.board)
+
+        return self._chess_board
+
+    def is_player(self, user):
+        return user.pk is not None and user.pk in (
+            self.white_player_id,
+            self.black_player_id,
+        )
+
+    def player_color(self, user):
+        """
+        chess.WHITE or chess.BLACK, or None if the user doesn't play this game
+        """
+
+        if user.pk is None:
+            return None
+
+        if user.pk == self.white_player_id:
+            return chess.WHITE
+
+        if user.pk == self.black_player_id:
+            return chess.BLACK
+
+        return None
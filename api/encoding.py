@@ -0,0 +1,116 @@
+"""
+Compact binary encodings of python-chess data
+"""
+
+import struct
+
+import chess
+import chess.polyglot
+
+MOVE_STRUCT = struct.Struct("<H")
+REPETITION_STRUCT = struct.Struct("<qH")
+
+
+def encode_move(move):
+    """
+    Pack a chess.Move in 16 bits:
+    from square (bits 0-5), to square (bits 6-11), promotion piece type (bits 12-15)
+
+    Null moves are encoded as 0, which decodes back to chess.Move.null()
+    """
+
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(value):
+    promotion = value >> 12
+
+    return chess.Move(value & 0x3F, value >> 6 & 0x3F, promotion=promotion or None)
+
+
+def pack_moves(moves):
+    return b"".join(MOVE_STRUCT.pack(encode_move(move)) for move in moves)
+
+
+def unpack_moves(data):
+    """
+    data: bytes, or the memoryview some database backends return for a BinaryField
+    """
+
+    return [decode_move(value) for (value,) in MOVE_STRUCT.iter_unpack(bytes(data))]
+
+
+def pack_repetitions(repetitions):
+    """
+    Pack a {position hash: occurrences} dict in 10 bytes per position
+    """
+
+    return b"".join(
+        REPETITION_STRUCT.pack(key, count) for key, count in repetitions.items()
+    )
+
+
+def unpack_repetitions(data):
+    return {key: count for key, count in REPETITION_STRUCT.iter_unpack(bytes(data))}
+
+
+def position_hash(chess_board):
+    """
+    Polyglot Zobrist hash of a position as a signed 64 bit integer, so that it fits a
+    BigIntegerField. It covers the pieces, the side to move, castling rights and
+    en passant captures, but not the move counters
+    """
+
+    value = chess.polyglot.zobrist_hash(chess_board)
+
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def replay(packed_move_stack, fen=chess.STARTING_FEN):
+    """
+    Replay a packed move stack from fen
+    Yields: ply, position_hash, move for every position, where move is the move played
+    from that position (None for the final one)
+    """
+
+    chess_board = chess.Board(fen)
+    moves = unpack_moves(packed_move_stack)
+
+    for ply, move in enumerate(moves):
+        yield ply, position_hash(chess_board), move
+        chess_board.push(move)
+
+    yield len(moves), position_hash(chess_board), None
+
+
+def first_positions(games):
+    """
+    games: iterable of (game uuid, packed move stack)
+    Returns: (game uuid, position hash, ply) for the first time each game reached each position
+
+    Does not need Django, so it can run in worker processes
+    """
+
+    rows = []
+
+    for game_uuid, packed_move_stack in games:
+        seen = set()
+
+        for ply, key, _ in replay(packed_move_stack):
+            if key not in seen:
+                seen.add(key)
+                rows.append((game_uuid, key, ply))
+
+    return rows
+
+
+def explorer_moves(packed_move_stack, max_ply):
+    """
+    Returns: the set of (position hash, move uci) pairs played in the first max_ply half moves
+    """
+
+    return {
+        (key, move.uci())
+        for ply, key, move in replay(packed_move_stack)
+        if move is not None and ply < max_ply
+    }
@@ -0,0 +1,159 @@
+"""
+Players sorted by rating, for the leaderboard and rank lookups
+"""
+
+from bisect import bisect_left, insort
+from threading import Lock
+
+import redis
+from django.conf import settings
+
+from .models import Elo
+
+
+def _load_ratings():
+    return Elo.objects.filter(player__isnull=False).values_list("player_id", "rating")
+
+
+class LocalLeaderboard:
+    """
+    Sorted list of (-rating, player id) in this process, for local development
+
+    Loaded from the database on first use and kept up to date by update().
+    Other processes don't see its updates, so use RedisLeaderboard with several workers
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._ratings = {}
+        self._loaded = False
+        self._lock = Lock()
+
+    def top(self, count):
+        """
+        Returns: [(player id, rating)] of the count best rated players
+        """
+
+        with self._lock:
+            self._load()
+
+            return [(player_id, -rating) for rating, player_id in self._entries[:count]]
+
+    def rank(self, player_id):
+        """
+        Returns: (rank from 1, rating) of a player, or None if they have no rating
+        """
+
+        with self._lock:
+            self._load()
+            rating = self._ratings.get(player_id)
+
+            if rating is None:
+                return None
+
+            return bisect_left(self._entries, (-rating, player_id)) + 1, rating
+
+    def update(self, ratings):
+        """
+        ratings: {player id: new rating}
+        """
+
+        with self._lock:
+            if not self._loaded:
+                return
+
+            for player_id, rating in ratings.items():
+                self._set(player_id, rating)
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._ratings = {}
+            self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+
+        for player_id, rating in _load_ratings():
+            self._set(player_id, rating)
+
+        self._loaded = True
+
+    def _set(self, player_id, rating):
+        previous_rating = self._ratings.get(player_id)
+
+        if previous_rating is not None:
+            del self._entries[bisect_left(self._entries, (-previous_rating, player_id))]
+
+        self._ratings[player_id] = rating
+        insort(self._entries, (-rating, player_id))
+
+
+class RedisLeaderboard:
+    """
+    Redis sorted set of player ids scored by rating, shared by every process
+
+    Loaded from the database until the "{key}:loaded" marker is set. update() always
+    writes, even before the load, and the load never overwrites a rating already in
+    the set, so a concurrent update wins over the ratings read by the load
+    """
+
+    def __init__(self, url, key="leaderboard"):
+        self.key = key
+        self.loaded_key = f"{key}:loaded"
+        self._redis = redis.Redis.from_url(url)
+
+    def top(self, count):
+        # ZREVRANGE 0 -1 would be the whole set
+        if count <= 0:
+            return []
+
+        self._load()
+
+        return [
+            (int(player_id), int(rating))
+            for player_id, rating in self._redis.zrevrange(
+                self.key, 0, count - 1, withscores=True
+            )
+        ]
+
+    def rank(self, player_id):
+        self._load()
+
+        with self._redis.pipeline() as pipeline:
+            rank, rating = (
+                pipeline.zrevrank(self.key, player_id)
+                .zscore(self.key, player_id)
+                .execute()
+            )
+
+        if rank is None:
+            return None
+
+        return rank + 1, int(rating)
+
+    def update(self, ratings):
+        if ratings:
+            self._redis.zadd(self.key, ratings)
+
+    def clear(self):
+        self._redis.delete(self.loaded_key, self.key)
+
+    def _load(self):
+        if self._redis.exists(self.loaded_key):
+            return
+
+        ratings = dict(_load_ratings())
+
+        if ratings:
+            self._redis.zadd(self.key, ratings, nx=True)
+
+        self._redis.set(self.loaded_key, 1)
+
+
+leaderboard = (
+    RedisLeaderboard(settings.LEADERBOARD_REDIS_URL)
+    if settings.LEADERBOARD_REDIS_URL
+    else LocalLeaderboard()
+)
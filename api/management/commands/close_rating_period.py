@@ -0,0 +1,118 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.constants import GLICKO_TAU
+from api.models import Elo, Game, RatingPeriod
+from api.ratings import glicko2_period
+from api.services import SCORES, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Close the Glicko-2 rating period: rate every game finished and not rated yet, "
+        "for every player at once"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per UPDATE",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            closed_at = timezone.now()
+
+            # Games are marked with the period that rated them rather than picked by
+            # finished_at, so a game committed after this query is left for the next period
+            finished_games = list(
+                Game.objects.select_for_update(of=("self",))
+                .filter(finished_at__lte=closed_at, rating_period__isnull=True)
+                .values_list(
+                    "pk", "white_player_id", "black_player_id", "result__result"
+                )
+            )
+            games = [
+                game[1:]
+                for game in finished_games
+                if None not in game[1:3] and game[1] != game[2] and game[3] in SCORES
+            ]
+
+            Elo.objects.bulk_create(
+                [
+                    Elo(player_id=player_id)
+                    for player_id in User.objects.values_list("pk", flat=True)
+                ],
+                ignore_conflicts=True,
+                batch_size=options["batch_size"],
+            )
+
+            # Locked in the same order as api.services.update_elo, not to deadlock with it
+            elos = list(
+                Elo.objects.select_for_update()
+                .filter(player__isnull=False)
+                .order_by("pk")
+                .values_list(
+                    "pk",
+                    "player_id",
+                    "glicko_rating",
+                    "rating_deviation",
+                    "volatility",
+                )
+            )
+            indexes = {
+                player_id: index for index, (_, player_id, *_) in enumerate(elos)
+            }
+            state = np.array([elo[2:] for elo in elos], dtype=np.float64).reshape(-1, 3)
+
+            white = np.array([indexes[game[0]] for game in games], dtype=np.int64)
+            black = np.array([indexes[game[1]] for game in games], dtype=np.int64)
+            white_scores = np.array(
+                [SCORES[game[2]][0] for game in games], dtype=np.float64
+            )
+
+            # Every game is rated from both sides
+            ratings, deviations, volatilities = glicko2_period(
+                state[:, 0],
+                state[:, 1],
+                state[:, 2],
+                np.concatenate([white, black]),
+                np.concatenate([black, white]),
+                np.concatenate([white_scores, 1 - white_scores]),
+                GLICKO_TAU,
+            )
+
+            Elo.objects.bulk_update(
+                [
+                    Elo(
+                        pk=pk,
+                        glicko_rating=float(ratings[index]),
+                        rating_deviation=float(deviations[index]),
+                        volatility=float(volatilities[index]),
+                    )
+                    for index, (pk, *_) in enumerate(elos)
+                ],
+                ["glicko_rating", "rating_deviation", "volatility"],
+                batch_size=options["batch_size"],
+            )
+
+            rating_period = RatingPeriod.objects.create(
+                closed_at=closed_at, games=len(games)
+            )
+            # Unrated ones too, such as games against oneself, not to select them again
+            game_ids = [game[0] for game in finished_games]
+
+            for start in range(0, len(game_ids), options["batch_size"]):
+                Game.objects.filter(
+                    pk__in=game_ids[start : start + options["batch_size"]]
+                ).update(rating_period=rating_period)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Closed a rating period of {len(games)} games for {len(elos)} players"
+            )
+        )
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from api.encoding import first_positions
+from api.models import Game, GamePosition
+
+
+class Command(BaseCommand):
+    help = "Replay every game and index the positions it reached, to search games by position"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes replaying games",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of games replayed by a worker at a time",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        batch_size = options["batch_size"]
+
+        games = (
+            (game_uuid, bytes(packed_move_stack))
+            for game_uuid, packed_move_stack in Game.objects.values_list(
+                "uuid", "board__packed_move_stack"
+            ).iterator()
+        )
+        batches = iter(lambda: list(islice(games, batch_size)), [])
+        indexed = 0
+
+        # Spawned workers only import api.encoding, so they never touch the
+        # database connection this process is streaming games from
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            pending = []
+
+            for batch in batches:
+                pending.append(executor.submit(first_positions, batch))
+
+                if len(pending) >= 2 * workers:
+                    indexed += self._save(pending.pop(0).result())
+
+            for future in pending:
+                indexed += self._save(future.result())
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} positions"))
+
+    def _save(self, rows):
+        GamePosition.objects.bulk_create(
+            [
+                GamePosition(game_id=game_uuid, position_hash=position_hash, ply=ply)
+                for game_uuid, position_hash, ply in rows
+            ],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+
+        return len(rows)
@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.constants import EXPLORER_MAX_PLY
+from api.encoding import explorer_moves
+from api.models import ExplorerMove, Game
+from api.services import EXPLORER_COLUMNS
+
+
+class Command(BaseCommand):
+    help = "Rebuild the opening explorer statistics from every finished game"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per INSERT",
+        )
+
+    def handle(self, *args, **options):
+        columns = list(EXPLORER_COLUMNS.values())
+        counts = defaultdict(lambda: [0] * len(columns))
+
+        games = Game.objects.filter(finished_at__isnull=False).values_list(
+            "result__result", "board__packed_move_stack"
+        )
+
+        for result, packed_move_stack in games.iterator():
+            column = EXPLORER_COLUMNS.get(result)
+
+            if column is None:
+                continue
+
+            for pair in explorer_moves(packed_move_stack, EXPLORER_MAX_PLY):
+                counts[pair][columns.index(column)] += 1
+
+        with transaction.atomic():
+            ExplorerMove.objects.all().delete()
+            ExplorerMove.objects.bulk_create(
+                (
+                    ExplorerMove(
+                        position_hash=key, uci=uci, **dict(zip(columns, results))
+                    )
+                    for (key, uci), results in counts.items()
+                ),
+                batch_size=options["batch_size"],
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(counts)} explorer moves"))
@@ -0,0 +1,100 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.constants import K_FACTOR
+from api.leaderboard import leaderboard
+from api.models import Elo, Game
+from api.ratings import count_scores, replay_elo
+from api.services import SCORE_COUNTERS, SCORES, User
+
+
+class Command(BaseCommand):
+    help = "Rebuild every player's Elo by rating every finished game again, in order"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per UPDATE",
+        )
+
+    def handle(self, *args, **options):
+        games = (
+            Game.objects.filter(
+                finished_at__isnull=False,
+                white_player__isnull=False,
+                black_player__isnull=False,
+                result__result__in=SCORES,
+            )
+            .order_by("finished_at", "pk")
+            .values_list("white_player_id", "black_player_id", "result__result")
+        )
+
+        player_ids = list(User.objects.order_by("pk").values_list("pk", flat=True))
+        indexes = {player_id: index for index, player_id in enumerate(player_ids)}
+        white, black, white_scores = [], [], []
+
+        for white_player_id, black_player_id, result in games.iterator():
+            white.append(indexes[white_player_id])
+            black.append(indexes[black_player_id])
+            white_scores.append(SCORES[result][0])
+
+        white = np.array(white, dtype=np.int64)
+        black = np.array(black, dtype=np.int64)
+        white_scores = np.array(white_scores, dtype=np.float64)
+        black_scores = 1 - white_scores
+        size = len(player_ids)
+
+        ratings = np.full(size, Elo._meta.get_field("rating").default, dtype=np.float64)
+        previous_ratings = replay_elo(white, black, white_scores, ratings, K_FACTOR)
+        counters = {
+            counter: count_scores(white, white_scores, score, size)
+            + count_scores(black, black_scores, score, size)
+            for score, counter in SCORE_COUNTERS.items()
+        }
+
+        with transaction.atomic():
+            Elo.objects.bulk_create(
+                [Elo(player_id=player_id) for player_id in player_ids],
+                ignore_conflicts=True,
+                batch_size=options["batch_size"],
+            )
+
+            now = timezone.now()
+            elos = []
+
+            # Locked in the same order as api.services.update_elo, not to deadlock with it
+            locked_elos = Elo.objects.select_for_update().order_by("pk")
+
+            for pk, player_id in locked_elos.values_list("pk", "player_id"):
+                index = indexes.get(player_id)
+
+                if index is None:
+                    continue
+
+                elos.append(
+                    Elo(
+                        pk=pk,
+                        rating=int(ratings[index]),
+                        previous_rating=int(previous_ratings[index]),
+                        wins=int(counters["wins"][index]),
+                        draws=int(counters["draws"][index]),
+                        losses=int(counters["losses"][index]),
+                        updated_at=now,
+                    )
+                )
+
+            Elo.objects.bulk_update(
+                elos,
+                ["rating", "previous_rating", "wins", "draws", "losses", "updated_at"],
+                batch_size=options["batch_size"],
+            )
+
+            transaction.on_commit(leaderboard.clear)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rated {len(white)} games for {len(elos)} players")
+        )
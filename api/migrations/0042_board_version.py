@@ -0,0 +1,16 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0041_auto_20200721_1015"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="board", name="version", field=models.IntegerField(default=0),
+        ),
+    ]
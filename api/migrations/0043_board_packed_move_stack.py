@@ -0,0 +1,62 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:00
+
+import struct
+
+import chess
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def pack_move_rows(apps, schema_editor):
+    """
+    Backfill Board.packed_move_stack from the Move rows of every board
+
+    The encoding is inlined (see api.encoding) so this migration does not change
+    if the application code does
+    """
+
+    Board = apps.get_model("api", "Board")
+    Move = apps.get_model("api", "Move")
+
+    board_ids = (
+        Move.objects.filter(board__isnull=False)
+        .values_list("board_id", flat=True)
+        .distinct()
+    )
+    boards = []
+
+    for board in Board.objects.filter(pk__in=board_ids).iterator():
+        packed = b""
+
+        for move_row in Move.objects.filter(board=board).order_by("created_at", "pk"):
+            move = chess.Move.from_uci(f"{move_row.from_square}{move_row.to_square}")
+            packed += struct.pack(
+                "<H",
+                move.from_square | move.to_square << 6 | (move.promotion or 0) << 12,
+            )
+
+        board.packed_move_stack = packed
+        boards.append(board)
+
+        if len(boards) >= BATCH_SIZE:
+            Board.objects.bulk_update(boards, ["packed_move_stack"])
+            boards = []
+
+    Board.objects.bulk_update(boards, ["packed_move_stack"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0042_board_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="board",
+            name="packed_move_stack",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(pack_move_rows, migrations.RunPython.noop),
+    ]
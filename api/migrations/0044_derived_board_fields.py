@@ -0,0 +1,16 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0043_board_packed_move_stack"),
+    ]
+
+    operations = [
+        migrations.RemoveField(model_name="board", name="board_fen",),
+        migrations.RemoveField(model_name="board", name="board_fen_flipped",),
+        migrations.RemoveField(model_name="board", name="castling_xfen",),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:10
+
+import chess
+import chess.polyglot
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def hash_positions(apps, schema_editor):
+    """
+    Backfill Board.position_hash from the FEN of every board (see api.encoding)
+    """
+
+    Board = apps.get_model("api", "Board")
+    boards = []
+
+    for board in Board.objects.only("pk", "fen").iterator():
+        value = chess.polyglot.zobrist_hash(chess.Board(board.fen))
+        board.position_hash = value - (1 << 64) if value >= 1 << 63 else value
+        boards.append(board)
+
+        if len(boards) >= BATCH_SIZE:
+            Board.objects.bulk_update(boards, ["position_hash"])
+            boards = []
+
+    Board.objects.bulk_update(boards, ["position_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0044_derived_board_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="board",
+            name="position_hash",
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.RunPython(hash_positions, migrations.RunPython.noop),
+    ]
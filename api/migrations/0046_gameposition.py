@@ -0,0 +1,39 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0045_board_position_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GamePosition",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position_hash", models.BigIntegerField()),
+                ("ply", models.IntegerField()),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="positions",
+                        to="api.Game",
+                    ),
+                ),
+            ],
+            options={"unique_together": {("position_hash", "game")},},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0046_gameposition"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExplorerMove",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position_hash", models.BigIntegerField()),
+                ("uci", models.CharField(max_length=5)),
+                ("white_wins", models.IntegerField(default=0)),
+                ("draws", models.IntegerField(default=0)),
+                ("black_wins", models.IntegerField(default=0)),
+            ],
+            options={"unique_together": {("position_hash", "uci")},},
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:40
+
+import struct
+
+import chess
+import chess.polyglot
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def _position_hash(chess_board):
+    value = chess.polyglot.zobrist_hash(chess_board)
+
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def count_repetitions(apps, schema_editor):
+    """
+    Backfill Board.packed_repetitions by replaying every board's move stack from the
+    starting position. Boards that did not start from it only count their current position
+
+    The encodings are inlined (see api.encoding) so this migration does not change
+    if the application code does
+    """
+
+    Board = apps.get_model("api", "Board")
+    boards = []
+
+    for board in Board.objects.iterator():
+        chess_board = chess.Board()
+        repetitions = {_position_hash(chess_board): 1}
+
+        try:
+            for (value,) in struct.iter_unpack("<H", bytes(board.packed_move_stack)):
+                promotion = value >> 12
+                chess_board.push(
+                    chess.Move(
+                        value & 0x3F, value >> 6 & 0x3F, promotion=promotion or None
+                    )
+                )
+                key = _position_hash(chess_board)
+
+                if chess_board.halfmove_clock == 0:
+                    repetitions = {}
+
+                repetitions[key] = repetitions.get(key, 0) + 1
+        except (AssertionError, ValueError):
+            chess_board = None
+
+        if chess_board is None or chess_board.fen() != board.fen:
+            repetitions = {_position_hash(chess.Board(board.fen)): 1}
+
+        board.packed_repetitions = b"".join(
+            struct.pack("<qH", key, count) for key, count in repetitions.items()
+        )
+        boards.append(board)
+
+        if len(boards) >= BATCH_SIZE:
+            Board.objects.bulk_update(boards, ["packed_repetitions"])
+            boards = []
+
+    Board.objects.bulk_update(boards, ["packed_repetitions"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0047_explorermove"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="board",
+            name="packed_repetitions",
+            field=models.BinaryField(default=bytes),
+        ),
+        migrations.RunPython(count_repetitions, migrations.RunPython.noop),
+    ]
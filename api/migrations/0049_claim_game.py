@@ -0,0 +1,24 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0048_board_packed_repetitions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="claim",
+            name="game",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="claims",
+                to="api.Game",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0049_claim_game"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(
+                fields=["-created_at", "-uuid"], name="game_created_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0050_game_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(
+                condition=models.Q(finished_at__isnull=True),
+                fields=["white_player", "-created_at", "-uuid"],
+                name="game_unfinished_white_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(
+                condition=models.Q(finished_at__isnull=True),
+                fields=["black_player", "-created_at", "-uuid"],
+                name="game_unfinished_black_idx",
+            ),
+        ),
+    ]
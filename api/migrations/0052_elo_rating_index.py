@@ -0,0 +1,18 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0051_unfinished_game_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="elo",
+            name="rating",
+            field=models.IntegerField(db_index=True, default=1200),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.0.7 on 2026-10-18 15:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0052_elo_rating_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingPeriod",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("closed_at", models.DateTimeField()),
+                ("games", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="elo",
+            name="glicko_rating",
+            field=models.FloatField(default=1500),
+        ),
+        migrations.AddField(
+            model_name="elo",
+            name="rating_deviation",
+            field=models.FloatField(default=350),
+        ),
+        migrations.AddField(
+            model_name="elo", name="volatility", field=models.FloatField(default=0.06),
+        ),
+        migrations.AddField(
+            model_name="game",
+            name="rating_period",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="rated_games",
+                to="api.RatingPeriod",
+            ),
+        ),
+    ]
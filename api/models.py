@@ -1,34 +1,56 @@
 import uuid
+from functools import lru_cache
 
 import chess
 from annoying.fields import AutoOneToOneField
 from django.conf import settings
 from django.db.models import (
     CASCADE,
+    SET_NULL,
+    BigIntegerField,
+    BinaryField,
     BooleanField,
     CharField,
     DateTimeField,
+    FloatField,
     ForeignKey,
+    Index,
     IntegerField,
     Model,
     OneToOneField,
+    Q,
     TextField,
     UUIDField,
 )
 
+from .encoding import (
+    MOVE_STRUCT,
+    pack_moves,
+    pack_repetitions,
+    position_hash,
+    unpack_moves,
+    unpack_repetitions,
+)
+
 
 class Elo(Model):
     """
     https://en.wikipedia.org/wiki/Elo_rating_system#Mathematical_details
+
+    Also holds the player's Glicko-2 rating, updated once per RatingPeriod
+    http://www.glicko.net/glicko/glicko2.pdf
     """
 
-    rating = IntegerField(default=1200)
+    rating = IntegerField(default=1200, db_index=True)
     previous_rating = IntegerField(default=1200)
     wins = IntegerField(default=0)
     losses = IntegerField(default=0)
     draws = IntegerField(default=0)
     updated_at = DateTimeField(auto_now=True)
     uuid = UUIDField(default=uuid.uuid4)
+    glicko_rating = FloatField(default=1500)
+    rating_deviation = FloatField(default=350)
+    volatility = FloatField(default=0.06)
 
     player = AutoOneToOneField(
         settings.AUTH_USER_MODEL, on_delete=CASCADE, null=True, related_name="elo"
@@ -99,6 +121,21 @@ class Result(Model):
         return self.result
 
 
+@lru_cache(maxsize=4096)
+def _derived_fen_fields(fen):
+    """
+    Representations of a position that are derived from its FEN, memoized per position
+    Returns: board_fen, board_fen_flipped, castling_xfen
+
+    The flipped board is the board seen from Black's side. Rotating a board by 180 degrees
+    reverses its piece placement string, so no python-chess transform is needed
+    """
+
+    board_fen, _, castling_xfen = fen.split(" ")[:3]
+
+    return board_fen, board_fen[::-1], castling_xfen
+
+
 class Board(Model):
     """
     python-chess Board data
@@ -107,22 +144,39 @@ class Board(Model):
     BLACK_PIECES = ["q", "k", "b", "n", "r", "p"]
     WHITE_PIECES = [p.upper() for p in BLACK_PIECES]
 
+    # Columns written by Board.update
+    STATE_FIELDS = [
+        "ep_square",
+        "turn",
+        "fullmove_number",
+        "halfmove_clock",
+        "castling_rights",
+        "fen",
+        "packed_move_stack",
+        "position_hash",
+        "packed_repetitions",
+        "version",
+        "updated_at",
+    ]
+
     fen = TextField(default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
-    board_fen = TextField(default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR")
-    board_fen_flipped = TextField(default="RNBKQBNR/PPPPPPPP/8/8/8/8/pppppppp/rnbkqbnr")
     ep_square = IntegerField(null=True)
-    castling_xfen = TextField(null=True)
     castling_rights = TextField(null=True)
     turn = BooleanField(default=True)
     fullmove_number = IntegerField(default=1)
     halfmove_clock = IntegerField(default=0)
+    version = IntegerField(default=0)
+    packed_move_stack = BinaryField(default=bytes)
+    position_hash = BigIntegerField(null=True, db_index=True)
+    packed_repetitions = BinaryField(default=bytes)
 
     updated_at = DateTimeField(auto_now=True)
     game_uuid = UUIDField(default=uuid.uuid4)
 
     def update(self, chess_board, *args, **kwargs):
         """
-        Updates all the information needed to recover a Board (except for the move stack)
+        Updates all the information needed to recover a Board
+        and bumps its version, so that cached copies of the previous position go stale
         """
 
         attributes = [
@@ -135,24 +189,74 @@ class Board(Model):
         for i in attributes:
             setattr(self, i, getattr(chess_board, i))
 
-        chess_board_flip_vert = chess_board.transform(chess.flip_vertical)
-        chess_board_rotated = chess_board_flip_vert.transform(chess.flip_horizontal)
-
         self.castling_rights = str(chess_board.castling_rights)
         self.fen = chess_board.fen()
-        self.board_fen = chess_board.board_fen()
-        self.board_fen_flipped = chess_board_rotated.board_fen()
-        self.castling_xfen = chess_board.castling_xfen()
+        self.position_hash = position_hash(chess_board)
+        self.packed_repetitions = pack_repetitions(self._count_position(chess_board))
+        self.packed_move_stack = pack_moves(chess_board.move_stack)
+        self.version += 1
 
-        self.save()
+        if self.pk is None:
+            self.save()
+        else:
+            self.save(update_fields=self.STATE_FIELDS)
+
+    def _count_position(self, chess_board):
+        """
+        Add the position of chess_board to the repetition counter
+
+        A position can't repeat across a capture or a pawn move, which is exactly when
+        the halfmove clock is reset, so the counter is reset along with it. That bounds
+        it by the seventy-five-move rule
+        """
+
+        repetitions = {} if chess_board.halfmove_clock == 0 else self.repetitions
+        repetitions[self.position_hash] = repetitions.get(self.position_hash, 0) + 1
+
+        return repetitions
+
+    @property
+    def repetitions(self):
+        """
+        Occurrences of every position since the last capture or pawn move, by position hash
+        """
+
+        return unpack_repetitions(self.packed_repetitions)
+
+    def repetition_count(self):
+        """
+        Number of times the current position has occurred
+        """
+
+        return self.repetitions.get(self.position_hash, 1)
 
     @property
     def move_stack(self):
-        if self.move_set:
-            moves = self.move_set.all()
-            move_ucis = [m.uci() for m in moves]
-            return move_ucis
-        return []
+        """
+        Decoded from packed_move_stack on access (see api.encoding), 2 bytes per move
+        """
+
+        return unpack_moves(self.packed_move_stack)
+
+    @property
+    def ply(self):
+        """
+        Number of half moves played, without decoding the move stack
+        """
+
+        return len(self.packed_move_stack) // MOVE_STRUCT.size
+
+    @property
+    def board_fen(self):
+        return _derived_fen_fields(self.fen)[0]
+
+    @property
+    def board_fen_flipped(self):
+        return _derived_fen_fields(self.fen)[1]
+
+    @property
+    def castling_xfen(self):
+        return _derived_fen_fields(self.fen)[2]
 
     @classmethod
     def from_fen(cls, fen):
@@ -162,15 +266,17 @@ class Board(Model):
         """
 
         board = chess.Board(fen)
+        key = position_hash(board)
 
         board_data = {
             "fen": fen,
             "turn": board.turn,
-            "castling_xfen": board.castling_xfen(),
             "castling_rights": board.castling_rights,
             "ep_square": board.ep_square,
             "fullmove_number": board.fullmove_number,
             "halfmove_clock": board.halfmove_clock,
+            "position_hash": key,
+            "packed_repetitions": pack_repetitions({key: 1}),
         }
 
         return cls(**board_data)
@@ -242,11 +348,73 @@ class Game(Model):
     finished_at = DateTimeField(null=True)
     result = OneToOneField(Result, on_delete=CASCADE,)
     board = OneToOneField(Board, on_delete=CASCADE,)
+    # Set by close_rating_period once the game has been rated
+    rating_period = ForeignKey(
+        "RatingPeriod", on_delete=SET_NULL, related_name="rated_games", null=True,
+    )
+
+    class Meta:
+        indexes = [
+            Index(fields=["-created_at", "-uuid"], name="game_created_at_idx"),
+            Index(
+                fields=["white_player", "-created_at", "-uuid"],
+                name="game_unfinished_white_idx",
+                condition=Q(finished_at__isnull=True),
+            ),
+            Index(
+                fields=["black_player", "-created_at", "-uuid"],
+                name="game_unfinished_black_idx",
+                condition=Q(finished_at__isnull=True),
+            ),
+        ]
+
+
+class GamePosition(Model):
+    """
+    Positions reached in a game, indexed by Board.position_hash
+    ply: number of half moves played when the game first reached the position
+    """
+
+    position_hash = BigIntegerField()
+    ply = IntegerField()
+    game = ForeignKey(Game, on_delete=CASCADE, related_name="positions")
+
+    class Meta:
+        unique_together = ["position_hash", "game"]
+
+
+class ExplorerMove(Model):
+    """
+    Opening explorer statistics: results of the finished games that played
+    a move (uci) from a position (position_hash)
+    """
+
+    position_hash = BigIntegerField()
+    uci = CharField(max_length=5)
+    white_wins = IntegerField(default=0)
+    draws = IntegerField(default=0)
+    black_wins = IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["position_hash", "uci"]
+
+
+class RatingPeriod(Model):
+    """
+    A closed Glicko-2 rating period, which rated the games finished by closed_at
+    that no previous period had rated (Game.rating_period)
+    games: number of games rated
+    """
+
+    closed_at = DateTimeField()
+    games = IntegerField(default=0)
 
 
 class Move(Model):
     """
     Each individual move that composes a board's move stack
+
+    Legacy: new moves are only stored in Board.packed_move_stack
     """
 
     created_at = DateTimeField(auto_now_add=True)
@@ -288,6 +456,7 @@ class Claim(Model):
     ]
 
     claim_type = CharField(max_length=2, choices=CLAIM_CHOICES,)
+    game = ForeignKey(Game, on_delete=CASCADE, null=True, related_name="claims")
 
     def __str__(self):
         return self.claim_type
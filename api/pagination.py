@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class GameCursorPagination(CursorPagination):
+    """
+    Keyset pagination over games, most recent first, served by the Game indexes
+    on created_at. Unlike limit/offset pagination there is no COUNT(*) and no OFFSET scan,
+    so deep pages cost the same as the first one
+    """
+
+    ordering = ("-created_at", "-uuid")
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+
+class GamePositionCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the games that reached a position,
+    served by the (position_hash, game) index
+    """
+
+    ordering = "game_id"
@@ -3,11 +3,8 @@ API permissions for checks such as piece ownership
 """
 
 import chess
-from django.contrib.auth import get_user_model
 from rest_framework import permissions
 
-User = get_user_model()
-
 
 class GamePermission(permissions.BasePermission):
     message = "That move is not valid or allowed"
@@ -17,30 +14,40 @@ class GamePermission(permissions.BasePermission):
         Allow players to see each other's pieces
         Only allow the owner of a piece to move it (i.e. if you play as White you can only move white pieces)
 
-        python-chess Piece.color is True for white pieces, False for black ones
-        obj: Game instance
+        obj: Game instance, also loaded in view.get_game_context()
         """
 
         if request.method in permissions.SAFE_METHODS:
             return True
 
         if view.action == "move":
-            from_square = request.data.get("from_square")
-            square = getattr(chess, from_square.upper())
-            board = chess.Board(obj.board.fen)
-            user = User.objects.get(username=request.user)
+            return can_move(
+                view.get_game_context(), request.user, request.data.get("from_square")
+            )
+
+        if view.action == "claim":
+            return view.get_game_context().is_player(request.user)
+
+        return True
 
-            if user in (obj.white_player, obj.black_player):
-                if obj.white_player == obj.black_player:
-                    return True
 
-                player_color = "white" if user == obj.white_player else "black"
+def can_move(context, user, from_square):
+    """
+    Whether a user may move the piece on from_square, e.g. "e2"
+    Shared by GamePermission and the game WebSocket
 
-            else:
-                return False
+    python-chess Piece.color is True for white pieces, False for black ones
+    context: GameContext
+    """
 
-            piece_color = "white" if board.color_at(square) else "black"
+    square = getattr(chess, from_square.upper())
 
-            return player_color == piece_color
+    if not context.is_player(user):
+        return False
 
+    if context.white_player_id == context.black_player_id:
         return True
+
+    piece_color = bool(context.chess_board.color_at(square))
+
+    return context.player_color(user) == piece_color
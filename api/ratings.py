@@ -0,0 +1,191 @@
+"""
+Batched rating computations over many games with NumPy
+"""
+
+import numpy as np
+
+
+def schedule_rounds(white, black):
+    """
+    Split games into rounds in which no player plays twice, keeping the order of
+    each player's games, so that a whole round can be rated at once
+
+    white, black: player indexes of every game, in the order the games were played
+    Returns: the round of every game
+    """
+
+    next_round = {}
+    rounds = np.empty(len(white), dtype=np.int64)
+
+    for game, (white_index, black_index) in enumerate(
+        zip(white.tolist(), black.tolist())
+    ):
+        game_round = max(next_round.get(white_index, 0), next_round.get(black_index, 0))
+        rounds[game] = game_round
+        next_round[white_index] = next_round[black_index] = game_round + 1
+
+    return rounds
+
+
+def expected_scores(ratings, opponent_ratings):
+    """
+    api.services._get_expected_score for arrays of ratings
+    """
+
+    return np.round(1 / (1 + 10 ** ((opponent_ratings - ratings) / 400)), 2)
+
+
+def replay_elo(white, black, white_scores, ratings, k_factor):
+    """
+    Rate games one after the other, as api.services.update_elo would, one round at a time
+
+    white, black: player indexes of every game, in the order the games were played
+    white_scores: 1, 0.5 or 0 for every game
+    ratings: rating of every player before the first game, updated in place
+    Returns: the rating of every player before their last game
+    """
+
+    previous_ratings = ratings.copy()
+
+    if not len(white):
+        return previous_ratings
+
+    rounds = schedule_rounds(white, black)
+    order = np.argsort(rounds, kind="stable")
+    boundaries = np.flatnonzero(np.diff(rounds[order])) + 1
+
+    for games in np.split(order, boundaries):
+        white_players, black_players = white[games], black[games]
+        white_ratings, black_ratings = ratings[white_players], ratings[black_players]
+        scores = white_scores[games]
+
+        white_changes = (
+            np.round(
+                white_ratings
+                + k_factor * (scores - expected_scores(white_ratings, black_ratings))
+            )
+            - white_ratings
+        )
+        black_changes = (
+            np.round(
+                black_ratings
+                + k_factor
+                * (1 - scores - expected_scores(black_ratings, white_ratings))
+            )
+            - black_ratings
+        )
+
+        previous_ratings[white_players] = white_ratings
+        previous_ratings[black_players] = black_ratings
+
+        # A player playing themselves gets both changes
+        np.add.at(ratings, white_players, white_changes)
+        np.add.at(ratings, black_players, black_changes)
+
+    return previous_ratings
+
+
+def count_scores(players, scores, score, size):
+    """
+    Returns: the number of games in which every player scored score
+    """
+
+    return np.bincount(players[scores == score], minlength=size)
+
+
+# Glicko-2 (http://www.glicko.net/glicko/glicko2.pdf)
+GLICKO_SCALE = 173.7178
+GLICKO_CONVERGENCE = 0.000001
+
+
+def glicko2_period(ratings, deviations, volatilities, players, opponents, scores, tau):
+    """
+    Rate a whole rating period at once, for every player
+
+    ratings, deviations, volatilities: Glicko-2 state of every player, on the Glicko scale
+    (1500, 350, 0.06 for a new player)
+    players, opponents, scores: one entry per game and side, so a game between
+    a and b is (a, b, score of a) and (b, a, score of b)
+    tau: constraint on the change of volatility
+
+    Returns: the new ratings, deviations and volatilities.
+    Players without games only have their deviation increased
+    """
+
+    size = len(ratings)
+    mu = (ratings - 1500) / GLICKO_SCALE
+    phi = deviations / GLICKO_SCALE
+
+    g = 1 / np.sqrt(1 + 3 * phi[opponents] ** 2 / np.pi ** 2)
+    expected = 1 / (1 + np.exp(-g * (mu[players] - mu[opponents])))
+
+    played = np.bincount(players, minlength=size) > 0
+    information = np.bincount(
+        players, weights=g ** 2 * expected * (1 - expected), minlength=size
+    )
+    improvement = np.bincount(players, weights=g * (scores - expected), minlength=size)
+
+    new_volatilities = volatilities.astype(np.float64)
+    new_phi = np.sqrt(phi ** 2 + volatilities ** 2)
+    new_mu = mu.copy()
+
+    if played.any():
+        variance = 1 / information[played]
+        delta = variance * improvement[played]
+        sigma = _glicko2_volatility(
+            delta, phi[played], variance, volatilities[played], tau
+        )
+        pre_phi = np.sqrt(phi[played] ** 2 + sigma ** 2)
+
+        new_volatilities[played] = sigma
+        new_phi[played] = 1 / np.sqrt(1 / pre_phi ** 2 + 1 / variance)
+        new_mu[played] = mu[played] + new_phi[played] ** 2 * improvement[played]
+
+    return (
+        new_mu * GLICKO_SCALE + 1500,
+        new_phi * GLICKO_SCALE,
+        new_volatilities,
+    )
+
+
+def _glicko2_volatility(delta, phi, variance, volatility, tau):
+    """
+    Step 5 of Glicko-2, the Illinois algorithm run for every player at once
+    """
+
+    a = np.log(volatility ** 2)
+
+    def f(x, i):
+        return (
+            np.exp(x)
+            * (delta[i] ** 2 - phi[i] ** 2 - variance[i] - np.exp(x))
+            / (2 * (phi[i] ** 2 + variance[i] + np.exp(x)) ** 2)
+            - (x - a[i]) / tau ** 2
+        )
+
+    everyone = np.arange(len(a))
+    A = a.copy()
+    B = np.log(np.abs(delta ** 2 - phi ** 2 - variance))
+
+    # Players whose upper bound isn't given by delta search for it below a
+    i = np.flatnonzero(delta ** 2 <= phi ** 2 + variance)
+    B[i] = a[i] - tau
+
+    while i.size:
+        i = i[f(B[i], i) < 0]
+        B[i] -= tau
+
+    f_A, f_B = f(A, everyone), f(B, everyone)
+    i = np.flatnonzero(np.abs(B - A) > GLICKO_CONVERGENCE)
+
+    while i.size:
+        C = A[i] + (A[i] - B[i]) * f_A[i] / (f_B[i] - f_A[i])
+        f_C = f(C, i)
+        crossed = f_C * f_B[i] <= 0
+
+        A[i] = np.where(crossed, B[i], A[i])
+        f_A[i] = np.where(crossed, f_B[i], f_A[i] / 2)
+        B[i], f_B[i] = C, f_C
+        i = i[np.abs(B[i] - A[i]) > GLICKO_CONVERGENCE]
+
+    return np.exp(A / 2)
@@ -3,7 +3,7 @@ from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 from . import services
-from .models import Board, Elo, Game, Result
+from .models import Board, Elo, ExplorerMove, Game, GamePosition, Result
 
 
 class EloSerializer(serializers.ModelSerializer):
@@ -16,11 +16,36 @@ class EloSerializer(serializers.ModelSerializer):
             "losses",
             "draws",
             "uuid",
+            "glicko_rating",
+            "rating_deviation",
+            "volatility",
         )
 
 
+class LeaderboardSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    username = serializers.CharField()
+    rating = serializers.IntegerField()
+
+
+class RelatedEloSerializer(EloSerializer):
+    """
+    AutoOneToOneField runs every access to user.elo in a transaction, even when
+    select_related already loaded it. The loaded Elo is read directly instead, and the
+    field is only used to create missing Elo rows
+    """
+
+    def get_attribute(self, instance):
+        try:
+            elo = get_user_model()._meta.get_field("elo").get_cached_value(instance)
+        except KeyError:
+            elo = None
+
+        return elo if elo is not None else instance.elo
+
+
 class UserEloSerializer(serializers.ModelSerializer):
-    elo = EloSerializer()
+    elo = RelatedEloSerializer()
 
     class Meta:
         model = get_user_model()
@@ -40,6 +65,7 @@ class BoardSerializer(serializers.ModelSerializer):
             "board_fen_flipped",
             "updated_at",
             "game_uuid",
+            "version",
         )
 
 
@@ -57,6 +83,8 @@ class GameSerializer(serializers.ModelSerializer):
     white_player = UserEloSerializer(required=False)
     board = BoardSerializer(required=False)
     result = ResultSerializer(required=False)
+    # Only present when the queryset annotates it (see GameViewSet.get_unfinished_games)
+    your_turn = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Game
@@ -69,6 +97,7 @@ class GameSerializer(serializers.ModelSerializer):
             "finished_at",
             "board",
             "result",
+            "your_turn",
         )
 
     def create(self, validated_data):
@@ -88,6 +117,28 @@ class GameSerializer(serializers.ModelSerializer):
         return game
 
 
+class GamePositionSerializer(serializers.ModelSerializer):
+    game = GameSerializer()
+
+    class Meta:
+        model = GamePosition
+        fields = (
+            "ply",
+            "game",
+        )
+
+
+class ExplorerMoveSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExplorerMove
+        fields = (
+            "uci",
+            "white_wins",
+            "draws",
+            "black_wins",
+        )
+
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     def validate(self, attrs):
         data = super().validate(attrs)
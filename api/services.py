@@ -1,12 +1,31 @@
+import logging
 import random
 import uuid
+from functools import reduce
+from operator import or_
 
 import chess
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
 
-from .constants import K_FACTOR
-from .models import Board, Game, Move, Result
+from .board_cache import board_cache
+from .constants import EXPLORER_MAX_PLY, K_FACTOR
+from .encoding import explorer_moves, pack_repetitions, position_hash
+from .leaderboard import leaderboard
+from .models import (
+    Board,
+    Claim,
+    ClaimItem,
+    Elo,
+    ExplorerMove,
+    Game,
+    GamePosition,
+    Result,
+)
+
+logger = logging.getLogger(__name__)
 
 RESULTS_DICT = {
     "1-0": Result.WHITE_WINS,
@@ -14,32 +33,79 @@ RESULTS_DICT = {
     "0-1": Result.BLACK_WINS,
 }
 
+EXPLORER_COLUMNS = {
+    Result.WHITE_WINS: "white_wins",
+    Result.DRAW: "draws",
+    Result.BLACK_WINS: "black_wins",
+}
+
+# Scores of white and black for each result
+SCORES = {
+    Result.WHITE_WINS: (1, 0),
+    Result.DRAW: (0.5, 0.5),
+    Result.BLACK_WINS: (0, 1),
+}
+
+# Elo counter incremented for each score
+SCORE_COUNTERS = {1: "wins", 0.5: "draws", 0: "losses"}
+
 User = get_user_model()
 
 
 # Game
 
 
-def is_game_over(game_instance):
+def game_result(chess_board, board_instance):
+    """
+    Return the result string ("1-0", "0-1" or "1/2-1/2") if the game is over, None if it is not
+
+    Fivefold repetition and the seventy-five-move rule are checked against the board's
+    repetition counter and halfmove clock, instead of letting python-chess replay the move stack
+    """
+
+    if chess_board.is_checkmate():
+        return "0-1" if chess_board.turn == chess.WHITE else "1-0"
+
+    if (
+        chess_board.is_stalemate()
+        or chess_board.is_insufficient_material()
+        or board_instance.halfmove_clock >= 150
+        or board_instance.repetition_count() >= 5
+    ):
+        return "1/2-1/2"
+
+    return None
+
+
+def can_claim_draw(board_instance, claim_type):
     """
-    Update the game if it is over
-    Return True if the game is over, False if it is not
+    Whether a player can claim a draw by threefold repetition (Claim.THREEFOLD_REPETITION)
+    or by the fifty-move rule (Claim.FIFTY_MOVES) in the current position
+
+    Draw offers (Claim.DRAW) need the opponent's agreement instead
     """
 
-    chess_board = chess_board_from_uuid(game_instance.uuid)
+    if claim_type == Claim.THREEFOLD_REPETITION:
+        return board_instance.repetition_count() >= 3
+
+    if claim_type == Claim.FIFTY_MOVES:
+        return board_instance.halfmove_clock >= 100
 
-    return chess_board.is_game_over()
+    return False
 
 
 def create_game(result_data=None, board_data=None, **validated_data):
     game_uuid = uuid.uuid4()
 
     chess_game = chess.Board()
+    key = position_hash(chess_game)
 
     board_object = Board.objects.create(
         **board_data,
         fen=chess.STARTING_FEN,
         castling_rights=chess_game.castling_rights,
+        position_hash=key,
+        packed_repetitions=pack_repetitions({key: 1}),
         game_uuid=game_uuid,
     )
 
@@ -49,17 +115,95 @@ def create_game(result_data=None, board_data=None, **validated_data):
         result=result_object, board=board_object, uuid=game_uuid, **validated_data
     )
 
+    index_position(game, board_object)
+
     return game
 
 
-def finish_game(game_instance, chess_board):
-    result_string = chess_board.result()
-    game_instance.result = Result(
-        result=RESULTS_DICT.get(result_string), termination=Result.NORMAL
-    )
+def finish_game(game_instance, result_string, termination=Result.NORMAL):
+    """
+    result_string: "1-0", "0-1" or "1/2-1/2"
+    """
+
+    game_instance.result.result = RESULTS_DICT.get(result_string)
+    game_instance.result.termination = termination
+    game_instance.result.save(update_fields=["result", "termination"])
+
     game_instance.finished_at = timezone.now()
-    game_instance.result.save()
-    game_instance.save()
+    game_instance.save(update_fields=["finished_at"])
+
+    update_explorer(game_instance)
+
+
+def update_explorer(game_instance):
+    """
+    Count the result of a finished game for every (position, move) pair it played
+
+    One INSERT creates the pairs that were never played before,
+    and one UPDATE increments the result column of all of them
+    """
+
+    column = EXPLORER_COLUMNS.get(game_instance.result.result)
+    pairs = explorer_moves(game_instance.board.packed_move_stack, EXPLORER_MAX_PLY)
+
+    if column is None or not pairs:
+        return
+
+    ExplorerMove.objects.bulk_create(
+        [ExplorerMove(position_hash=key, uci=uci) for key, uci in pairs],
+        ignore_conflicts=True,
+    )
+
+    ExplorerMove.objects.filter(
+        reduce(or_, (Q(position_hash=key, uci=uci) for key, uci in pairs))
+    ).update(**{column: F(column) + 1})
+
+
+def claim_draw(game_instance, player, claim_type):
+    """
+    Record a player's draw claim, and finish the game as a draw if the claim holds
+
+    Threefold repetition and fifty-move claims hold if can_claim_draw allows them.
+    Draw offers (Claim.DRAW) hold once both players have made one since the last move
+    Returns: True if the game was drawn, False if it was not
+    """
+
+    board_instance = game_instance.board
+
+    with transaction.atomic():
+        version, finished_at = _lock_board(board_instance)
+
+        if finished_at:
+            return False
+
+        if version != board_instance.version:
+            board_instance.refresh_from_db()
+
+        claim, _ = Claim.objects.get_or_create(
+            game=game_instance, claim_type=claim_type
+        )
+        ClaimItem.objects.create(player=player, claim=claim)
+
+        if claim_type == Claim.DRAW:
+            players = set(
+                claim.claimitem_set.filter(
+                    timestamp__gte=board_instance.updated_at
+                ).values_list("player_id", flat=True)
+            )
+            drawn = players >= {
+                game_instance.white_player_id,
+                game_instance.black_player_id,
+            }
+
+        else:
+            drawn = can_claim_draw(board_instance, claim_type)
+
+        if drawn:
+            finish_game(game_instance, "1/2-1/2", termination=Result.NORMAL)
+            update_elo(game_instance)
+            bump_version(game_instance)
+
+    return drawn
 
 
 def assign_color(game_instance, username, preferred_color="white"):
@@ -86,51 +230,139 @@ def assign_color(game_instance, username, preferred_color="white"):
         game_instance.white_player = auth_user
 
     game_instance.save()
+    bump_version(game_instance)
 
     return player_color
 
 
+def bump_version(game_instance):
+    """
+    Increment Board.version for changes to a game other than moves, such as a player
+    joining or a draw, so that clients polling the game see them (see GameViewSet.retrieve),
+    and push the game to its WebSocket group once the transaction commits
+    """
+
+    Board.objects.filter(pk=game_instance.board_id).update(version=F("version") + 1)
+
+    # Not imported at module level, stream_app.services imports api modules that import this one
+    from stream_app import services as stream_services
+
+    if Game.board.is_cached(game_instance):
+        game_instance.board.refresh_from_db(fields=["version"])
+
+    transaction.on_commit(lambda: stream_services.publish_snapshot(game_instance))
+
+
 # Board
 
 
 def move_piece(board_instance, from_square, to_square, chess_board=None):
     """
     Make a move if it is legal, and check if the game is over
-    """
 
-    if not chess_board:
-        chess_board = chess_board_from_uuid(board_instance.game_uuid)
+    The board row stays locked for the whole move. The new position is written with a
+    single UPDATE and game over is detected on the python-chess Board in hand
+    Returns: the move, or None if it is illegal or the game is already over
+    """
 
     requested_move = chess.Move.from_uci(f"{from_square}{to_square}")
 
-    if requested_move in chess_board.legal_moves:
-        chess_board.push(requested_move)
+    with transaction.atomic():
+        version, finished_at = _lock_board(board_instance)
 
-        Move.objects.create(
-            from_square=from_square, to_square=to_square, board=board_instance
-        )
+        if finished_at:
+            return None
+
+        if version != board_instance.version:
+            # Someone else moved since board_instance was loaded
+            board_instance.refresh_from_db()
+            chess_board = None
+
+        if not chess_board:
+            chess_board = chess_board_from_board(board_instance)
+
+        if requested_move not in chess_board.legal_moves:
+            return None
+
+        chess_board.push(requested_move)
 
         board_instance.update(chess_board)
+        _cache_on_commit(board_instance, chess_board)
 
         if hasattr(board_instance, "game"):
-            if is_game_over(board_instance.game):
-                finish_game(board_instance.game, chess_board)
+            index_position(board_instance.game, board_instance)
+
+            result_string = game_result(chess_board, board_instance)
+
+            if result_string:
+                finish_game(board_instance.game, result_string)
                 update_elo(board_instance.game)
 
-        return requested_move
+            _publish_on_commit(board_instance.game, requested_move)
 
-    return None
+    return requested_move
+
+
+def _lock_board(board_instance):
+    """
+    Lock the board row until the end of the transaction
+    Returns: its current version, and when its game finished (None if it didn't)
+    """
+
+    return (
+        Board.objects.select_for_update(of=("self",))
+        .values_list("version", "game__finished_at")
+        .get(pk=board_instance.pk)
+    )
+
+
+def index_position(game_instance, board_instance):
+    """
+    Record the current position of a game's board, unless the game reached it before
+    """
+
+    GamePosition.objects.bulk_create(
+        [
+            GamePosition(
+                game=game_instance,
+                position_hash=board_instance.position_hash,
+                ply=board_instance.ply,
+            )
+        ],
+        ignore_conflicts=True,
+    )
 
 
 def chess_board_from_uuid(board_uuid):
+    board = Board.objects.get(game_uuid=board_uuid)
+
+    return chess_board_from_board(board)
+
+
+def chess_board_from_board(board_instance):
+    """
+    Return the live python-chess Board of a Board instance
+
+    The per-process board cache is tried first, and the board is only rebuilt
+    from the database when the cache has nothing for the current Board.version
+    """
+
+    chess_board = board_cache.get(board_instance.game_uuid, board_instance.version)
+
+    if chess_board is None:
+        chess_board = _build_chess_board(board_instance)
+        board_cache.set(board_instance.game_uuid, board_instance.version, chess_board)
+
+    return chess_board
+
+
+def _build_chess_board(board):
     """
     It's safe to set turn, castling_rights, ep_square, halfmove_clock and fullmove_number directly.
 
     https://python-chess.readthedocs.io/en/latest/core.html#chess.Board
     """
 
-    board = Board.objects.get(game_uuid=board_uuid)
-
     chess_board = chess.Board(board.fen)
 
     chess_board.ep_square = int(board.ep_square) if board.ep_square else None
@@ -143,6 +375,29 @@ def chess_board_from_uuid(board_uuid):
     return chess_board
 
 
+def _cache_on_commit(board_instance, chess_board):
+    """
+    Only cache the new position once it is committed, otherwise a rolled back
+    move could be served under a version that another worker reuses
+    """
+
+    game_uuid = board_instance.game_uuid
+    version = board_instance.version
+    chess_board = chess_board.copy()
+
+    transaction.on_commit(lambda: board_cache.set(game_uuid, version, chess_board))
+
+
+def _publish_on_commit(game_instance, move):
+    """
+    Push the move to the game's WebSocket group once the transaction commits
+    """
+
+    from stream_app import services as stream_services
+
+    transaction.on_commit(lambda: stream_services.publish_move(game_instance, move))
+
+
 def create_board_from_pgn(pgn_file, starting_at=0):
     board_instance = None
     chess_board = None
@@ -217,42 +472,87 @@ def update_elo_rating(player_score=None, player=None, opponent=None, previous=Fa
 def update_elo(game_instance):
     """
     Update the ELO of a game's players according to the game's result
+
+    Both Elo rows are locked and read once, so that games finishing at the same time
+    are rated one after the other. Both ratings are computed from the ratings before
+    the game, and both rows are written with a single UPDATE
     Returns: white_elo, black_elo
     """
 
     white = game_instance.white_player
     black = game_instance.black_player
+    scores = SCORES.get(game_instance.result.result)
+
+    if scores is None:
+        return white.elo, black.elo
 
-    scores = {
-        "white": 0,
-        "black": 0,
-    }
+    with transaction.atomic():
+        elos = _lock_elos([white.pk, black.pk])
+        ratings = {player_id: elo.rating for player_id, elo in elos.items()}
 
-    result = game_instance.result.result
+        for player, opponent, score in zip((white, black), (black, white), scores):
+            elo = elos[player.pk]
+            elo.rating += (
+                get_rating(score, ratings[player.pk], ratings[opponent.pk])
+                - ratings[player.pk]
+            )
+            counter = SCORE_COUNTERS[score]
+            setattr(elo, counter, getattr(elo, counter) + 1)
 
-    if result == Result.DRAW:
-        scores["white"] += 0.5
-        scores["black"] += 0.5
-        white.elo.draws += 1
-        black.elo.draws += 1
+        now = timezone.now()
 
-    elif result == Result.WHITE_WINS:
-        scores["white"] += 1
-        white.elo.wins += 1
-        black.elo.losses += 1
+        for player_id, elo in elos.items():
+            elo.previous_rating = ratings[player_id]
+            elo.updated_at = now
 
-    elif result == Result.BLACK_WINS:
-        scores["black"] += 1
-        black.elo.wins += 1
-        white.elo.losses += 1
+        Elo.objects.bulk_update(
+            elos.values(),
+            ["rating", "previous_rating", "wins", "losses", "draws", "updated_at"],
+        )
+
+        new_ratings = {player_id: elo.rating for player_id, elo in elos.items()}
+        transaction.on_commit(lambda: _update_leaderboard(new_ratings))
+
+    # Keep player.elo up to date for the callers that hold the players
+    for player in (white, black):
+        User._meta.get_field("elo").set_cached_value(player, elos[player.pk])
+
+    return elos[white.pk], elos[black.pk]
+
+
+def _update_leaderboard(ratings):
+    """
+    Called after the ratings are committed, so failures are logged rather than raised,
+    not to stop the hooks queued after it, such as publishing the move
+    """
 
-    white.elo.save()
-    black.elo.save()
+    try:
+        leaderboard.update(ratings)
 
-    update_elo_rating(player_score=scores["white"], player=white, opponent=black)
+    except Exception:
+        logger.exception(
+            "Could not update the leaderboard for players %s", list(ratings)
+        )
+
+
+def _lock_elos(player_ids):
+    """
+    Lock the Elo rows of players until the end of the transaction, creating the missing ones
+    Returns: {player id: Elo}
+    """
 
-    update_elo_rating(
-        player_score=scores["black"], player=black, opponent=white, previous=True
+    # Rows are always locked in the same order, so concurrent games can't deadlock
+    locked_elos = (
+        Elo.objects.select_for_update().filter(player_id__in=player_ids).order_by("pk")
     )
+    elos = {elo.player_id: elo for elo in locked_elos}
+    missing = set(player_ids) - set(elos)
+
+    if missing:
+        Elo.objects.bulk_create(
+            [Elo(player_id=player_id) for player_id in missing], ignore_conflicts=True
+        )
+
+        return _lock_elos(player_ids)
 
-    return white.elo, black.elo
+    return elos
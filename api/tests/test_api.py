@@ -1,7 +1,15 @@
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import chess
 import chess.pgn
+from api import services
+from api.leaderboard import leaderboard
 from api.models import Game, Result
-from api.views import GameViewSet
+from api.views import EloViewSet, ExplorerViewSet, GameViewSet
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 
 factory = APIRequestFactory()
@@ -25,6 +33,10 @@ class TestAPI(APITestCase):
         self.unfinished_game_view = GameViewSet.as_view(
             {"get": "get_unfinished_games",}
         )
+        self.search_game_view = GameViewSet.as_view({"get": "search",})
+        self.explorer_view = ExplorerViewSet.as_view({"get": "list",})
+        self.claim_view = GameViewSet.as_view({"post": "claim",})
+        self.leaderboard_view = EloViewSet.as_view({"get": "leaderboard",})
 
     def _create_game(self, preferred_color="random"):
         data = {"preferred_color": preferred_color}
@@ -57,6 +69,60 @@ class TestAPI(APITestCase):
 
         return response
 
+    def _play_fools_mate(self):
+        with open("api/pgn_games/fools_mate.pgn") as f:
+            moves = chess.pgn.read_game(f).mainline_moves()
+
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+
+        self._join_game(game_uuid, self.user_two, preferred_color="black")
+
+        for counter, move in enumerate(moves):
+            uci = move.uci()
+            user = self.user_one if counter % 2 == 0 else self.user_two
+            self._move_piece(
+                game_uuid, {"from_square": uci[:2], "to_square": uci[2:]}, user
+            )
+
+        return game_uuid
+
+    def _claim(self, uuid, claim_type, user):
+        request = factory.post(f"/api/game/{uuid}/claim/", {"claim_type": claim_type})
+        force_authenticate(request, user=user)
+
+        return self.claim_view(request, pk=uuid)
+
+    def _count_queries(self, view, path, user):
+        request = factory.get(path)
+        force_authenticate(request, user=user)
+
+        with CaptureQueriesContext(connection) as queries:
+            view(request)
+
+        return len(queries)
+
+    def _assert_queries_do_not_grow(self, view, path):
+        """
+        Listing a few games or a full page of them must run the same queries
+        """
+
+        for _ in range(2):
+            response = self._create_game(preferred_color="white")
+            self._join_game(response.data.get("uuid"), self.user_two)
+
+        # The first listing creates the players' Elo rows
+        self._count_queries(view, path, self.user_one)
+        few_games_queries = self._count_queries(view, path, self.user_one)
+
+        for _ in range(6):
+            response = self._create_game(preferred_color="white")
+            self._join_game(response.data.get("uuid"), self.user_two)
+
+        many_games_queries = self._count_queries(view, path, self.user_one)
+
+        self.assertEqual(few_games_queries, many_games_queries)
+
     def _get_unfinished_games(self, user):
         request = factory.get("/api/game/")
         force_authenticate(request, user=user)
@@ -233,3 +299,246 @@ class TestAPI(APITestCase):
         self.assertEqual(
             game_response.data.get("uuid"), response.data.get("results")[0].get("uuid")
         )
+
+    def test_can_search_games_by_position(self):
+        game_response = self._create_game(preferred_color="white")
+        game_uuid = game_response.data.get("uuid")
+
+        self._move_piece(
+            game_uuid, {"from_square": "e2", "to_square": "e4"}, self.user_one
+        )
+
+        chess_board = chess.Board()
+        chess_board.push_uci("e2e4")
+
+        request = factory.get("/api/game/search/", {"fen": chess_board.fen()})
+        force_authenticate(request, user=self.user_two)
+        response = self.search_game_view(request)
+
+        self.assertEqual(1, len(response.data.get("results")))
+        self.assertEqual(1, response.data.get("results")[0].get("ply"))
+        self.assertEqual(
+            game_uuid, response.data.get("results")[0].get("game").get("uuid")
+        )
+
+    def test_search_rejects_invalid_fen(self):
+        request = factory.get("/api/game/search/", {"fen": "not a fen"})
+        force_authenticate(request, user=self.user_one)
+        response = self.search_game_view(request)
+
+        self.assertEqual(400, response.status_code)
+
+    def test_explorer_counts_finished_games(self):
+        self._play_fools_mate()
+
+        request = factory.get("/api/explorer/", {"fen": chess.STARTING_FEN})
+        force_authenticate(request, user=self.user_one)
+        response = self.explorer_view(request)
+
+        self.assertEqual(1, len(response.data))
+        self.assertEqual("f2f4", response.data[0].get("uci"))
+        self.assertEqual(1, response.data[0].get("black_wins"))
+        self.assertEqual(0, response.data[0].get("white_wins"))
+
+    def test_can_claim_threefold_repetition(self):
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+        self._join_game(game_uuid, self.user_two, preferred_color="black")
+
+        self.assertEqual(400, self._claim(game_uuid, "tr", self.user_one).status_code)
+
+        for counter, uci in enumerate(["g1f3", "g8f6", "f3g1", "f6g8"] * 2):
+            user = self.user_one if counter % 2 == 0 else self.user_two
+            self._move_piece(
+                game_uuid, {"from_square": uci[:2], "to_square": uci[2:]}, user
+            )
+
+        response = self._claim(game_uuid, "tr", self.user_one)
+
+        self.assertEqual(Result.DRAW, response.data.get("result").get("result"))
+        self.assertEqual(Result.NORMAL, response.data.get("result").get("termination"))
+
+    def test_draw_needs_both_players(self):
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+        self._join_game(game_uuid, self.user_two, preferred_color="black")
+
+        offer_response = self._claim(game_uuid, "d", self.user_one)
+        accept_response = self._claim(game_uuid, "d", self.user_two)
+
+        self.assertEqual(202, offer_response.status_code)
+        self.assertEqual(Result.DRAW, accept_response.data.get("result").get("result"))
+
+    def test_invalid_claims_are_rejected(self):
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+
+        self.assertEqual(400, self._claim(game_uuid, "xx", self.user_one).status_code)
+        self.assertEqual(403, self._claim(game_uuid, "d", self.user_two).status_code)
+
+    def test_move_parses_the_board_once(self):
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+
+        with mock.patch(
+            "api.services._build_chess_board", wraps=services._build_chess_board
+        ) as build_chess_board, mock.patch.object(
+            services.User.objects, "get", wraps=services.User.objects.get
+        ) as get_user:
+            self._move_piece(
+                game_uuid, {"from_square": "e2", "to_square": "e4"}, self.user_one
+            )
+
+        build_chess_board.assert_called_once()
+        get_user.assert_not_called()
+
+    def test_game_list_queries_do_not_grow(self):
+        self._assert_queries_do_not_grow(self.game_list_view, "/api/game/")
+
+    def test_unfinished_games_queries_do_not_grow(self):
+        self._assert_queries_do_not_grow(
+            self.unfinished_game_view, "/api/game/get_unfinished_games/"
+        )
+
+    def test_game_list_is_cursor_paginated(self):
+        uuids = [self._create_game().data.get("uuid") for _ in range(3)]
+
+        request = factory.get("/api/game/", {"limit": 2})
+        force_authenticate(request, user=self.user_one)
+        first_page = self.game_list_view(request)
+
+        cursor = parse_qs(urlparse(first_page.data.get("next")).query)["cursor"][0]
+        request = factory.get("/api/game/", {"limit": 2, "cursor": cursor})
+        force_authenticate(request, user=self.user_one)
+        second_page = self.game_list_view(request)
+
+        listed = [
+            game.get("uuid")
+            for page in (first_page, second_page)
+            for game in page.data.get("results")
+        ]
+
+        self.assertNotIn("count", first_page.data)
+        self.assertIsNone(second_page.data.get("next"))
+        self.assertEqual(list(reversed(uuids)), listed)
+
+    def test_unfinished_games_exclude_finished_ones(self):
+        finished_game_uuid = self._play_fools_mate()
+        game_uuid = self._create_game(preferred_color="white").data.get("uuid")
+        self._join_game(game_uuid, self.user_two, preferred_color="black")
+
+        white_games = self._get_unfinished_games(self.user_one).data.get("results")
+        black_games = self._get_unfinished_games(self.user_two).data.get("results")
+
+        self.assertNotIn(finished_game_uuid, [g.get("uuid") for g in white_games])
+        self.assertEqual([game_uuid], [g.get("uuid") for g in white_games])
+        self.assertTrue(white_games[0].get("your_turn"))
+        self.assertFalse(black_games[0].get("your_turn"))
+
+    def test_get_game_not_modified(self):
+        game_uuid = self._create_game(preferred_color="white").data.get("uuid")
+        response = self._get_game(game_uuid, self.user_two)
+        etag = response["ETag"]
+
+        get_request = factory.get(f"/api/game/{game_uuid}/", HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(get_request, user=self.user_two)
+
+        with CaptureQueriesContext(connection) as queries:
+            not_modified = self.game_detail_view(get_request, pk=game_uuid)
+
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(len(queries), 1)
+
+        self._join_game(game_uuid, self.user_two)
+        get_request = factory.get(f"/api/game/{game_uuid}/", HTTP_IF_NONE_MATCH=etag)
+        force_authenticate(get_request, user=self.user_two)
+        response = self.game_detail_view(get_request, pk=game_uuid)
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            response["ETag"], f'"{response.data.get("board").get("version")}"'
+        )
+
+    def test_get_game_cors(self):
+        game_uuid = self._create_game(preferred_color="white").data.get("uuid")
+        origin = "http://localhost:3000"
+
+        preflight = self.client.options(
+            f"/api/game/{game_uuid}/",
+            HTTP_ORIGIN=origin,
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD="GET",
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS="if-none-match",
+        )
+
+        self.assertIn("if-none-match", preflight["Access-Control-Allow-Headers"])
+
+        response = self.client.get(f"/api/game/{game_uuid}/", HTTP_ORIGIN=origin)
+
+        self.assertEqual(response["Access-Control-Expose-Headers"], "ETag")
+
+    def test_leaderboard(self):
+        self.user_one.elo.rating = 1250
+        self.user_one.elo.save()
+        self.user_two.elo.rating = 1300
+        self.user_two.elo.save()
+        leaderboard.clear()
+
+        request = factory.get("/api/elo/leaderboard/", {"limit": 2})
+        force_authenticate(request, user=self.user_one)
+        response = self.leaderboard_view(request)
+
+        self.assertEqual(
+            [
+                {"rank": 1, "username": "blackie_lawless", "rating": 1300},
+                {"rank": 2, "username": "whitey_morgan", "rating": 1250},
+            ],
+            response.data,
+        )
+
+        request = factory.get("/api/elo/leaderboard/", {"username": "whitey_morgan"})
+        force_authenticate(request, user=self.user_one)
+        response = self.leaderboard_view(request)
+
+        self.assertEqual(
+            {"rank": 2, "username": "whitey_morgan", "rating": 1250}, response.data
+        )
+
+        for limit in (0, -1, "x"):
+            request = factory.get("/api/elo/leaderboard/", {"limit": limit})
+            force_authenticate(request, user=self.user_one)
+
+            self.assertEqual(400, self.leaderboard_view(request).status_code)
+
+        leaderboard.clear()
+
+    def test_finished_games_refuse_moves(self):
+        response = self._create_game(preferred_color="white")
+        game_uuid = response.data.get("uuid")
+        self._join_game(game_uuid, self.user_two, preferred_color="black")
+        self._claim(game_uuid, "d", self.user_one)
+        self._claim(game_uuid, "d", self.user_two)
+
+        response = self._move_piece(
+            game_uuid, {"from_square": "f2", "to_square": "f4"}, self.user_one
+        )
+        game = Game.objects.get(uuid=game_uuid)
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual({"detail": "The game is already over."}, response.data)
+        self.assertEqual(Result.DRAW, game.result.result)
+        self.assertEqual(chess.STARTING_FEN, game.board.fen)
+        self.assertEqual(
+            (1, 0, 0),
+            (
+                game.white_player.elo.draws,
+                game.white_player.elo.wins,
+                game.white_player.elo.losses,
+            ),
+        )
+
+    def test_get_game_with_invalid_uuid(self):
+        response = self._get_game("not-a-uuid", self.user_one)
+
+        self.assertEqual(404, response.status_code)
@@ -0,0 +1,51 @@
+import chess
+import pytest
+
+from api import services
+from api.board_cache import BoardCache
+from api.models import Board
+
+
+def test_board_cache_evicts_least_recently_used():
+    cache = BoardCache(maxsize=2)
+    chess_board = chess.Board()
+
+    cache.set("first", 0, chess_board)
+    cache.set("second", 0, chess_board)
+    cache.get("first", 0)
+    cache.set("third", 0, chess_board)
+
+    assert len(cache) == 2
+    assert cache.get("second", 0) is None
+    assert cache.get("first", 0) is not None
+
+
+def test_board_cache_drops_stale_versions():
+    cache = BoardCache(maxsize=2)
+
+    cache.set("game", 1, chess.Board())
+
+    assert cache.get("game", 2) is None
+    assert cache.get("game", 1) is None
+
+
+def test_board_cache_returns_copies():
+    cache = BoardCache(maxsize=2)
+
+    cache.set("game", 0, chess.Board())
+    cache.get("game", 0).push_uci("e2e4")
+
+    assert cache.get("game", 0).fen() == chess.STARTING_FEN
+
+
+@pytest.mark.django_db
+def test_chess_board_from_board_uses_cache(django_assert_num_queries):
+    board_instance = Board.from_fen(chess.STARTING_FEN)
+    board_instance.save()
+
+    chess_board = services.chess_board_from_board(board_instance)
+
+    with django_assert_num_queries(0):
+        cached_chess_board = services.chess_board_from_board(board_instance)
+
+    assert cached_chess_board.fen() == chess_board.fen()
@@ -0,0 +1,142 @@
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from api import services
+from api.models import Elo, ExplorerMove, Game, GamePosition, RatingPeriod
+from fixtures import users
+
+
+@pytest.mark.django_db
+def test_index_positions(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+
+    for uci in ["g1f3", "g8f6", "f3g1", "f6g8", "e2e4"]:
+        services.move_piece(game.board, uci[:2], uci[2:])
+
+    indexed = set(GamePosition.objects.values_list("position_hash", "ply"))
+    GamePosition.objects.all().delete()
+
+    call_command("index_positions", workers=1)
+
+    assert set(GamePosition.objects.values_list("position_hash", "ply")) == indexed
+    assert len(indexed) == 5
+
+
+@pytest.mark.django_db
+def test_rebuild_explorer(users):
+    player, opponent = users
+
+    for _ in range(2):
+        game = services.create_game(
+            result_data={}, board_data={}, white_player=player, black_player=opponent
+        )
+
+        for uci in ["f2f3", "e7e5", "g2g4", "d8h4"]:
+            services.move_piece(game.board, uci[:2], uci[2:])
+
+    statistics = set(
+        ExplorerMove.objects.values_list("position_hash", "uci", "black_wins")
+    )
+    ExplorerMove.objects.all().delete()
+
+    call_command("rebuild_explorer")
+
+    assert (
+        set(ExplorerMove.objects.values_list("position_hash", "uci", "black_wins"))
+        == statistics
+    )
+    assert {black_wins for _, _, black_wins in statistics} == {2}
+
+
+@pytest.mark.django_db
+def test_rebuild_ratings(users):
+    player, opponent = users
+    third_player = services.User.objects.create(username="saulgoodman")
+    pairings = [
+        (player, opponent, "1-0"),
+        (opponent, third_player, "1/2-1/2"),
+        (third_player, player, "0-1"),
+        (player, player, "1-0"),
+        (opponent, player, "1-0"),
+        (player, third_player, "1/2-1/2"),
+    ]
+
+    for white_player, black_player, result in pairings:
+        game = services.create_game(
+            result_data={},
+            board_data={},
+            white_player=white_player,
+            black_player=black_player,
+        )
+        services.finish_game(game, result)
+        services.update_elo(game)
+
+    fields = ("player_id", "rating", "previous_rating", "wins", "draws", "losses")
+    ratings = set(Elo.objects.values_list(*fields))
+    Elo.objects.update(rating=1200, previous_rating=1200, wins=0, draws=0, losses=0)
+
+    call_command("rebuild_ratings", batch_size=2)
+
+    assert set(Elo.objects.values_list(*fields)) == ratings
+    assert len({rating for _, rating, *_ in ratings}) > 1
+
+
+@pytest.mark.django_db
+def test_close_rating_period(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    services.finish_game(game, "1-0")
+
+    call_command("close_rating_period")
+
+    winner = Elo.objects.get(player=player)
+    loser = Elo.objects.get(player=opponent)
+
+    assert winner.glicko_rating == pytest.approx(3000 - loser.glicko_rating)
+    assert winner.glicko_rating > 1500
+    assert winner.rating_deviation == loser.rating_deviation < 350
+    assert RatingPeriod.objects.get().games == 1
+
+    # The game was already rated, so the next period only makes ratings less certain
+    call_command("close_rating_period")
+    winner_after = Elo.objects.get(player=player)
+
+    assert winner_after.glicko_rating == winner.glicko_rating
+    assert winner_after.rating_deviation > winner.rating_deviation
+    assert list(
+        RatingPeriod.objects.order_by("closed_at").values_list("games", flat=True)
+    ) == [1, 0]
+
+
+@pytest.mark.django_db
+def test_close_rating_period_late_game(users):
+    player, opponent = users
+    late_game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    services.finish_game(late_game, "0-1")
+    self_play = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=player
+    )
+    services.finish_game(self_play, "1-0")
+    finished_at = timezone.now()
+
+    # The late game's transaction had not committed when the period closed
+    Game.objects.filter(pk=late_game.pk).update(finished_at=None)
+    call_command("close_rating_period")
+    Game.objects.filter(pk=late_game.pk).update(finished_at=finished_at)
+    call_command("close_rating_period")
+
+    first_period, second_period = RatingPeriod.objects.order_by("closed_at")
+
+    assert first_period.closed_at > finished_at
+    assert list(first_period.rated_games.all()) == [self_play]
+    assert list(second_period.rated_games.all()) == [late_game]
+    assert second_period.games == 1
+    assert Elo.objects.get(player=opponent).glicko_rating > 1500
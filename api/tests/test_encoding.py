@@ -0,0 +1,44 @@
+import chess
+
+from api import encoding
+
+
+def test_move_round_trip():
+    moves = [
+        chess.Move.from_uci("e2e4"),
+        chess.Move.from_uci("h7h8q"),
+        chess.Move.from_uci("a2a1n"),
+        chess.Move.null(),
+    ]
+
+    packed = encoding.pack_moves(moves)
+
+    assert len(packed) == 2 * len(moves)
+    assert encoding.unpack_moves(packed) == moves
+
+
+def test_unpack_memoryview():
+    packed = encoding.pack_moves([chess.Move.from_uci("g1f3")])
+
+    assert encoding.unpack_moves(memoryview(packed)) == [chess.Move.from_uci("g1f3")]
+
+
+def test_position_hash_fits_a_signed_bigint():
+    chess_board = chess.Board()
+    hashes = set()
+
+    for uci in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5", "a7a6"]:
+        chess_board.push_uci(uci)
+        value = encoding.position_hash(chess_board)
+
+        assert -(1 << 63) <= value < 1 << 63
+        hashes.add(value)
+
+    assert len(hashes) == 6
+
+
+def test_position_hash_ignores_move_counters():
+    first = chess.Board("8/8/8/4k3/8/8/4K3/8 w - - 0 40")
+    second = chess.Board("8/8/8/4k3/8/8/4K3/8 w - - 12 57")
+
+    assert encoding.position_hash(first) == encoding.position_hash(second)
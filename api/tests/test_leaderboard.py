@@ -0,0 +1,85 @@
+from unittest import mock
+
+import pytest
+
+from api.leaderboard import LocalLeaderboard, RedisLeaderboard
+from fixtures import users
+
+
+@pytest.mark.django_db
+def test_local_leaderboard(users):
+    player, opponent = users
+    player.elo.rating = 1300
+    player.elo.save()
+    opponent.elo.save()
+    leaderboard = LocalLeaderboard()
+
+    assert leaderboard.top(10) == [(player.pk, 1300), (opponent.pk, 1200)]
+    assert leaderboard.rank(opponent.pk) == (2, 1200)
+
+    leaderboard.update({opponent.pk: 1350})
+
+    assert leaderboard.top(1) == [(opponent.pk, 1350)]
+    assert leaderboard.rank(player.pk) == (2, 1300)
+    assert leaderboard.rank(0) is None
+
+
+@pytest.mark.django_db
+def test_local_leaderboard_loads_after_clear(users):
+    player, _ = users
+    player.elo.save()
+    leaderboard = LocalLeaderboard()
+
+    # Not loaded yet, the next lookup loads the rating from the database
+    leaderboard.update({player.pk: 1500})
+
+    assert leaderboard.rank(player.pk) == (1, 1200)
+
+    leaderboard.clear()
+    player.elo.rating = 1400
+    player.elo.save()
+
+    assert leaderboard.top(1) == [(player.pk, 1400)]
+
+
+def test_redis_leaderboard_top():
+    with mock.patch("redis.Redis.from_url") as from_url:
+        leaderboard = RedisLeaderboard("redis://localhost:6379/0")
+        client = from_url.return_value
+        client.exists.return_value = True
+        client.zrevrange.return_value = [(b"2", 1300.0), (b"1", 1250.0)]
+
+        assert leaderboard.top(0) == []
+        assert leaderboard.top(-1) == []
+        assert not client.zrevrange.called
+
+        assert leaderboard.top(2) == [(2, 1300), (1, 1250)]
+        client.zrevrange.assert_called_once_with("leaderboard", 0, 1, withscores=True)
+
+
+@pytest.mark.django_db
+def test_redis_leaderboard_load(users):
+    player, opponent = users
+    player.elo.save()
+    opponent.elo.save()
+
+    with mock.patch("redis.Redis.from_url") as from_url:
+        leaderboard = RedisLeaderboard("redis://localhost:6379/0")
+        client = from_url.return_value
+        client.exists.return_value = False
+        client.zrevrange.return_value = []
+
+        # Written before the load, which must not overwrite it
+        leaderboard.update({player.pk: 1250})
+        client.zadd.assert_called_once_with("leaderboard", {player.pk: 1250})
+
+        leaderboard.top(10)
+
+        client.exists.assert_called_with("leaderboard:loaded")
+        client.zadd.assert_called_with(
+            "leaderboard", {player.pk: 1200, opponent.pk: 1200}, nx=True
+        )
+        client.set.assert_called_once_with("leaderboard:loaded", 1)
+
+        leaderboard.clear()
+        client.delete.assert_called_once_with("leaderboard:loaded", "leaderboard")
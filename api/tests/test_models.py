@@ -1,6 +1,7 @@
 import pytest
 import chess
 
+from api import encoding
 from api.models import Board
 
 
@@ -13,6 +14,7 @@ def test_board_from_fen():
     assert board.halfmove_clock == 0
     assert board.fullmove_number == 1
     assert board.castling_xfen == "KQkq"
+    assert board.position_hash == encoding.position_hash(chess_board)
 
 
 @pytest.mark.django_db
@@ -26,3 +28,31 @@ def test_get_empty_move_stack():
 def test_board_model_string():
     board = Board()
     assert str(board) == board.fen
+
+
+@pytest.mark.django_db
+def test_move_stack_is_packed():
+    chess_board = chess.Board()
+    board = Board.from_fen(chess_board.fen())
+
+    chess_board.push_uci("e2e4")
+    chess_board.push_uci("e7e5")
+    board.update(chess_board)
+    board.refresh_from_db()
+
+    assert len(board.packed_move_stack) == 4
+    assert board.move_stack == chess_board.move_stack
+
+
+def test_derived_board_fields():
+    chess_board = chess.Board(
+        "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+    )
+    rotated = chess_board.transform(chess.flip_vertical).transform(
+        chess.flip_horizontal
+    )
+    board = Board.from_fen(chess_board.fen())
+
+    assert board.board_fen == chess_board.board_fen()
+    assert board.board_fen_flipped == rotated.board_fen()
+    assert board.castling_xfen == chess_board.castling_xfen()
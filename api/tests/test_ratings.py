@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from api import ratings, services
+
+
+def test_schedule_rounds():
+    white = np.array([0, 2, 1, 0, 3])
+    black = np.array([1, 3, 2, 0, 4])
+
+    assert ratings.schedule_rounds(white, black).tolist() == [0, 0, 1, 1, 1]
+
+
+def test_replay_elo():
+    """
+    Same ratings as rating the games one by one with services.get_rating
+    """
+
+    white = np.array([0, 1, 2, 0])
+    black = np.array([1, 2, 0, 2])
+    white_scores = np.array([1, 0.5, 0, 1])
+    expected = [1200.0, 1300.0, 1400.0]
+
+    for white_index, black_index, score in zip(white, black, white_scores):
+        white_rating = expected[white_index]
+        black_rating = expected[black_index]
+        expected[white_index] = services.get_rating(score, white_rating, black_rating)
+        expected[black_index] = services.get_rating(
+            1 - score, black_rating, white_rating
+        )
+
+    player_ratings = np.array([1200.0, 1300.0, 1400.0])
+    ratings.replay_elo(white, black, white_scores, player_ratings, services.K_FACTOR)
+
+    assert player_ratings.tolist() == expected
+
+
+def test_glicko2_period():
+    """
+    The example of http://www.glicko.net/glicko/glicko2.pdf
+    """
+
+    players = np.array([0, 1, 0, 2, 0, 3])
+    opponents = np.array([1, 0, 2, 0, 3, 0])
+    scores = np.array([1, 0, 0, 1, 0, 1])
+
+    new_ratings, new_deviations, new_volatilities = ratings.glicko2_period(
+        np.array([1500.0, 1400, 1550, 1700, 1500]),
+        np.array([200.0, 30, 100, 300, 350]),
+        np.full(5, 0.06),
+        players,
+        opponents,
+        scores,
+        tau=0.5,
+    )
+
+    # The paper rounds its intermediate results
+    assert new_ratings[0] == pytest.approx(1464.06, abs=0.01)
+    assert new_deviations[0] == pytest.approx(151.52, abs=0.01)
+    assert new_volatilities[0] == pytest.approx(0.05999, abs=0.00001)
+
+    # A player without games only becomes less certain
+    assert new_ratings[4] == 1500
+    assert new_volatilities[4] == 0.06
+    assert 350 < new_deviations[4] < 351
@@ -4,7 +4,7 @@ import chess
 import chess.pgn
 import pytest
 from api import services
-from api.models import Board, Game, Result
+from api.models import Board, Claim, Game, Result
 from fixtures import users, game_instance
 
 
@@ -42,6 +42,93 @@ def test_chess_board_from_uuid():
     assert chess_board.board_fen() == new_chess_board.board_fen()
 
 
+@pytest.mark.django_db
+def test_move_piece_query_count(users, django_assert_num_queries):
+    """
+    A move is SAVEPOINT, SELECT ... FOR UPDATE of the board version,
+    one UPDATE of the board, one INSERT into the position index and RELEASE SAVEPOINT
+    """
+
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    board_instance = game.board
+
+    with django_assert_num_queries(5):
+        services.move_piece(board_instance, "e2", "e4")
+
+    with django_assert_num_queries(5):
+        services.move_piece(board_instance, "e7", "e5")
+
+    board_instance.refresh_from_db()
+
+    assert board_instance.version == 2
+    assert [m.uci() for m in board_instance.move_stack] == ["e2e4", "e7e5"]
+
+
+@pytest.mark.django_db
+def test_move_piece_reloads_stale_board(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    stale_board_instance = Board.objects.get(pk=game.board.pk)
+
+    services.move_piece(game.board, "e2", "e4")
+
+    assert services.move_piece(stale_board_instance, "e2", "e4") is None
+    assert services.move_piece(stale_board_instance, "e7", "e5")
+    assert stale_board_instance.version == 2
+
+
+KNIGHT_SHUFFLE = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+@pytest.mark.django_db
+def test_repetitions_are_counted(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    board_instance = game.board
+
+    for uci in KNIGHT_SHUFFLE * 2:
+        services.move_piece(board_instance, uci[:2], uci[2:])
+
+    assert board_instance.repetition_count() == 3
+    assert services.can_claim_draw(board_instance, Claim.THREEFOLD_REPETITION)
+    assert not services.can_claim_draw(board_instance, Claim.FIFTY_MOVES)
+
+    services.move_piece(board_instance, "e2", "e4")
+
+    assert board_instance.repetitions == {board_instance.position_hash: 1}
+    assert not services.can_claim_draw(board_instance, Claim.THREEFOLD_REPETITION)
+
+
+@pytest.mark.django_db
+def test_fivefold_repetition_ends_the_game(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+
+    for uci in KNIGHT_SHUFFLE * 4:
+        services.move_piece(game.board, uci[:2], uci[2:])
+
+    game.refresh_from_db()
+
+    assert game.finished_at is not None
+    assert game.result.result == Result.DRAW
+
+
+def test_can_claim_fifty_moves():
+    board_instance = Board.from_fen("8/8/8/4k3/8/8/4K2R/8 w - - 100 80")
+
+    assert services.can_claim_draw(board_instance, Claim.FIFTY_MOVES)
+    assert not services.can_claim_draw(board_instance, Claim.DRAW)
+
+
 @pytest.mark.django_db
 def test_create_board_from_pgn():
     board_instance, chess_board = services.create_board_from_pgn(
@@ -163,3 +250,87 @@ def test_update_elo_white_wins(users, game_instance):
 
     assert player.elo.wins == 1
     assert opponent.elo.wins == 0
+
+
+@pytest.mark.django_db
+def test_update_elo_query_count(users, game_instance, django_assert_num_queries):
+    """
+    One locked read and one write, in a savepoint
+    """
+
+    player, opponent = users
+    game_instance.result = Result(result=Result.WHITE_WINS)
+
+    # AutoOneToOneField creates the Elo rows on first access
+    player.elo
+    opponent.elo
+
+    with django_assert_num_queries(4):
+        white_elo, black_elo = services.update_elo(game_instance)
+
+    white_elo.refresh_from_db()
+    black_elo.refresh_from_db()
+
+    assert (white_elo.rating, white_elo.previous_rating, white_elo.wins) == (
+        1216,
+        1200,
+        1,
+    )
+    assert (black_elo.rating, black_elo.previous_rating, black_elo.losses) == (
+        1184,
+        1200,
+        1,
+    )
+
+
+@pytest.mark.django_db
+def test_update_elo_self_play(users):
+    player, _ = users
+    game = Game(
+        board=Board.from_fen(chess.STARTING_FEN),
+        white_player=player,
+        black_player=player,
+        result=Result(result=Result.WHITE_WINS),
+    )
+
+    services.update_elo(game)
+    player.elo.refresh_from_db()
+
+    assert player.elo.rating == 1200
+    assert player.elo.wins == 1
+    assert player.elo.losses == 1
+
+
+@pytest.mark.django_db
+def test_move_piece_refuses_finished_games(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+    services.finish_game(game, "1/2-1/2")
+
+    assert services.move_piece(game.board, "e2", "e4") is None
+
+    game.board.refresh_from_db()
+
+    assert game.board.fen == chess.STARTING_FEN
+
+
+@pytest.mark.django_db(transaction=True)
+def test_leaderboard_errors_dont_stop_the_move(users):
+    player, opponent = users
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=player, black_player=opponent
+    )
+
+    with mock.patch.object(
+        services.leaderboard, "update", side_effect=ConnectionError
+    ), mock.patch("stream_app.services.publish_move") as publish_move:
+        for uci in ["f2f3", "e7e5", "g2g4", "d8h4"]:
+            assert services.move_piece(game.board, uci[:2], uci[2:])
+
+    game.refresh_from_db()
+
+    assert game.result.result == Result.BLACK_WINS
+    # The last move is still published, after the failed leaderboard update
+    assert publish_move.call_args[0][1].uci() == "d8h4"
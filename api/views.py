@@ -1,27 +1,88 @@
+import chess
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.db.models import BooleanField, Case, F, Q, Value, When
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 from . import services
-from .models import Elo, Game
+from .constants import LEADERBOARD_SIZE
+from .context import GameContext
+from .encoding import position_hash
+from .leaderboard import leaderboard
+from .models import Claim, Elo, ExplorerMove, Game, GamePosition
+from .pagination import GameCursorPagination, GamePositionCursorPagination
 from .permissions import GamePermission
-from .serializers import CustomTokenObtainPairSerializer, EloSerializer, GameSerializer
+from .serializers import (
+    CustomTokenObtainPairSerializer,
+    EloSerializer,
+    ExplorerMoveSerializer,
+    GamePositionSerializer,
+    GameSerializer,
+    LeaderboardSerializer,
+)
 
 User = get_user_model()
 
 
 class GameViewSet(viewsets.ModelViewSet):
     serializer_class = GameSerializer
-    queryset = Game.objects.all().order_by("-created_at")
+    queryset = Game.objects.select_related(
+        "board", "result", "white_player__elo", "black_player__elo"
+    ).order_by("-created_at")
+    pagination_class = GameCursorPagination
 
     permission_classes = [
         GamePermission,
     ]
 
+    def get_game_context(self):
+        """
+        Load the game of a detail action once per request
+        """
+
+        if not hasattr(self, "_game_context"):
+            game = get_object_or_404(self.get_queryset(), uuid=self.kwargs.get("pk"))
+            self._game_context = GameContext(game)
+
+        return self._game_context
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Get a game, with its board version as ETag
+
+        If-None-Match is answered from the board version alone, so polling a game
+        that did not change doesn't load its players, ratings or result
+        """
+
+        try:
+            version = (
+                Game.objects.filter(uuid=kwargs.get("pk"))
+                .values_list("board__version", flat=True)
+                .first()
+            )
+        except (TypeError, ValueError, ValidationError):
+            # Not a uuid, get_object() answers 404
+            version = None
+
+        if version is not None:
+            etag = quote_etag(str(version))
+            if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+
+            if etag in if_none_match or "*" in if_none_match:
+                return Response(
+                    status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+                )
+
+        response = super().retrieve(request, *args, **kwargs)
+        response["ETag"] = quote_etag(str(response.data["board"]["version"]))
+
+        return response
+
     @action(detail=True, methods=["put"])
     def move(self, request, *args, **kwargs):
         """
@@ -31,19 +92,22 @@ class GameViewSet(viewsets.ModelViewSet):
         from_square = request.data.get("from_square")
         to_square = request.data.get("to_square")
 
-        game_uuid = kwargs.get("pk")
-
-        game = get_object_or_404(Game, uuid=game_uuid)
+        context = self.get_game_context()
 
-        board = game.board
-        auth_user = User.objects.get(username=request.user)
+        self.check_object_permissions(self.request, context.game)
 
-        self.check_object_permissions(self.request, game)
+        if context.game.finished_at:
+            return Response(
+                data={"detail": "The game is already over."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        move = services.move_piece(board, from_square, to_square)
+        move = services.move_piece(
+            context.board, from_square, to_square, chess_board=context.chess_board
+        )
 
         if move:
-            return Response(self.serializer_class(game).data)
+            return Response(self.serializer_class(context.game).data)
 
         else:
             return Response(
@@ -51,6 +115,45 @@ class GameViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+    @action(detail=True, methods=["post"])
+    def claim(self, request, *args, **kwargs):
+        """
+        Claim a draw by threefold repetition ("tr") or the fifty-move rule ("ft"),
+        or offer a draw ("d"), which ends the game once both players have offered one
+        """
+
+        claim_type = request.data.get("claim_type")
+        claim_name = dict(Claim.CLAIM_CHOICES).get(claim_type)
+
+        game = self.get_game_context().game
+
+        self.check_object_permissions(self.request, game)
+
+        if claim_name is None:
+            return Response(
+                data={"detail": f"{claim_type} is not a valid claim type."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if game.finished_at:
+            return Response(
+                data={"detail": "The game is already over."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if services.claim_draw(game, request.user, claim_type):
+            return Response(self.serializer_class(game).data)
+
+        if claim_type == Claim.DRAW:
+            return Response(
+                data={"detail": "Draw offered."}, status=status.HTTP_202_ACCEPTED,
+            )
+
+        return Response(
+            data={"detail": f"{claim_name} can't be claimed in this position."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=True, methods=["put"])
     def join(self, request, *args, **kwargs):
         """
@@ -71,13 +174,27 @@ class GameViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def get_unfinished_games(self, request, *args, **kwargs):
         """
-        Get a list of unfinished games played by the user
+        Get a list of unfinished games played by the user, and whether it's their turn
         """
 
         user = self.request.user
-        games = Game.objects.filter(
-            Q(white_player=user) | Q(black_player=user)
-        ).order_by("-created_at")
+        games = (
+            self.get_queryset()
+            .filter(
+                Q(white_player=user) | Q(black_player=user), finished_at__isnull=True
+            )
+            .annotate(
+                your_turn=Case(
+                    When(
+                        Q(white_player=user, board__turn=True)
+                        | Q(black_player=user, board__turn=False),
+                        then=Value(True),
+                    ),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                )
+            )
+        )
 
         page = self.paginate_queryset(games)
         serialized_games = self.get_serializer(page, many=True).data
@@ -88,6 +205,37 @@ class GameViewSet(viewsets.ModelViewSet):
             else Response(data=serialized_games)
         )
 
+    @action(detail=False, methods=["get"])
+    def search(self, request, *args, **kwargs):
+        """
+        Get the games that reached the position given by the fen query parameter
+        """
+
+        fen = request.query_params.get("fen", "")
+
+        try:
+            chess_board = chess.Board(fen)
+        except ValueError:
+            return Response(
+                data={"detail": f"{fen} is not a valid FEN."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        positions = GamePosition.objects.filter(
+            position_hash=position_hash(chess_board)
+        ).select_related(
+            "game__board",
+            "game__result",
+            "game__white_player__elo",
+            "game__black_player__elo",
+        )
+
+        paginator = GamePositionCursorPagination()
+        page = paginator.paginate_queryset(positions, request, view=self)
+        serialized_positions = GamePositionSerializer(page, many=True).data
+
+        return paginator.get_paginated_response(serialized_positions)
+
 
 class EloViewSet(
     mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet
@@ -96,6 +244,84 @@ class EloViewSet(
     serializer_class = EloSerializer
     lookup_field = "uuid"
 
+    @action(detail=False, methods=["get"])
+    def leaderboard(self, request, *args, **kwargs):
+        """
+        Get the best rated players (up to the limit query parameter),
+        or the rank of the player given by the username query parameter
+        """
+
+        username = request.query_params.get("username")
+
+        if username is not None:
+            player = get_object_or_404(User, username=username)
+            entry = leaderboard.rank(player.pk)
+
+            if entry is None:
+                return Response(
+                    data={"detail": f"{username} has no rating."},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+            rank, rating = entry
+            data = {"rank": rank, "username": username, "rating": rating}
+
+            return Response(LeaderboardSerializer(data).data)
+
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 0
+
+        if limit < 1:
+            return Response(
+                data={"detail": "limit must be a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        top = leaderboard.top(min(limit, LEADERBOARD_SIZE))
+        usernames = dict(
+            User.objects.filter(pk__in=[player_id for player_id, _ in top]).values_list(
+                "pk", "username"
+            )
+        )
+        data = [
+            {"rank": rank, "username": usernames.get(player_id), "rating": rating}
+            for rank, (player_id, rating) in enumerate(top, start=1)
+        ]
+
+        return Response(LeaderboardSerializer(data, many=True).data)
+
+
+class ExplorerViewSet(viewsets.GenericViewSet):
+    queryset = ExplorerMove.objects.all()
+    serializer_class = ExplorerMoveSerializer
+
+    def list(self, request, *args, **kwargs):
+        """
+        Get the moves played from the position given by the fen query parameter,
+        with the results of the games that played them, most played first
+        """
+
+        fen = request.query_params.get("fen", "")
+
+        try:
+            chess_board = chess.Board(fen)
+        except ValueError:
+            return Response(
+                data={"detail": f"{fen} is not a valid FEN."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        moves = (
+            self.get_queryset()
+            .filter(position_hash=position_hash(chess_board))
+            .annotate(games=F("white_wins") + F("draws") + F("black_wins"))
+            .order_by("-games", "uci")
+        )
+
+        return Response(data=self.get_serializer(moves, many=True).data)
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -1,4 +1,4 @@
-from api.views import EloViewSet, GameViewSet
+from api.views import EloViewSet, ExplorerViewSet, GameViewSet
 from django.conf import settings
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
@@ -13,6 +13,7 @@ else:
 router.register("users", UserViewSet)
 router.register("game", GameViewSet)
 router.register("elo", EloViewSet)
+router.register("explorer", ExplorerViewSet)
 
 app_name = "api"
 urlpatterns = router.urls
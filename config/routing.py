@@ -1,11 +1,23 @@
 import stream_app.routing
-from channels.auth import AuthMiddlewareStack
+from channels.http import AsgiHandler
 from channels.routing import ProtocolTypeRouter, URLRouter
+from django.urls import re_path
+from stream_app.executor import DatabaseExecutor
+from stream_app.middleware import JWTAuthMiddlewareStack, SiteOriginValidator
 
-application = ProtocolTypeRouter(
-    {
-        "websocket": AuthMiddlewareStack(
-            URLRouter(stream_app.routing.websocket_urlpatterns)
-        ),
-    }
+application = DatabaseExecutor(
+    ProtocolTypeRouter(
+        {
+            "http": URLRouter(
+                stream_app.routing.http_urlpatterns(AsgiHandler)
+                # Everything else is served by Django
+                + [re_path(r"", AsgiHandler)]
+            ),
+            "websocket": SiteOriginValidator(
+                JWTAuthMiddlewareStack(
+                    URLRouter(stream_app.routing.websocket_urlpatterns)
+                )
+            ),
+        }
+    )
 )
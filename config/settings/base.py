@@ -5,6 +5,7 @@ from pathlib import Path
 
 import environ
 import datetime
+from corsheaders.defaults import default_headers
 
 ROOT_DIR = Path(__file__).resolve(strict=True).parent.parent.parent
 # chess_api_project/
@@ -307,6 +308,9 @@ CORS_ALLOW_CREDENTIALS = True
 CORS_ORIGIN_WHITELIST = [
     "http://localhost:3000",
 ]
+# Conditional requests of games (see GameViewSet.retrieve)
+CORS_ALLOW_HEADERS = list(default_headers) + ["if-none-match"]
+CORS_EXPOSE_HEADERS = ["ETag"]
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": datetime.timedelta(minutes=0.2),
@@ -321,3 +325,33 @@ CHANNEL_LAYERS = {
         "CONFIG": {"hosts": [("127.0.0.1", 6379)],},
     },
 }
+
+# Board cache
+# Number of live python-chess boards kept in memory by each process
+BOARD_CACHE_SIZE = env.int("DJANGO_BOARD_CACHE_SIZE", default=1024)
+
+# Long polling
+# Seconds GET /api/game/{uuid}/wait/ waits for a move before answering 204 No Content
+LONG_POLL_TIMEOUT = env.int("DJANGO_LONG_POLL_TIMEOUT", default=30)
+
+# Game WebSocket
+# Events a player's socket may have waiting before it is disconnected
+GAME_OUTBOX_SIZE = env.int("DJANGO_GAME_OUTBOX_SIZE", default=100)
+# Seconds of events collapsed into one frame for spectators (0 sends every event)
+GAME_COALESCE_WINDOW = env.float("DJANGO_GAME_COALESCE_WINDOW", default=0)
+
+# Serialized games
+# Seconds a serialized game stays cached for a board version (see stream_app.services)
+SERIALIZED_GAME_CACHE_TIMEOUT = env.int(
+    "DJANGO_SERIALIZED_GAME_CACHE_TIMEOUT", default=300
+)
+
+# ASGI
+# Threads running the database work of the ASGI consumers, and so at most as many
+# database connections per process
+DATABASE_EXECUTOR_WORKERS = env.int("DJANGO_DATABASE_EXECUTOR_WORKERS", default=10)
+
+# Leaderboard
+# Redis database of the leaderboard sorted set. Without one every process keeps its
+# own sorted list, which is only up to date with a single process
+LEADERBOARD_REDIS_URL = env("DJANGO_LEADERBOARD_REDIS_URL", default="")
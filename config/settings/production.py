@@ -28,6 +28,7 @@ CACHES = {
         },
     }
 }
+LEADERBOARD_REDIS_URL = env("DJANGO_LEADERBOARD_REDIS_URL", default=env("REDIS_URL"))
 
 # SECURITY
 # ------------------------------------------------------------------------------
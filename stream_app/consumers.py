@@ -1,24 +1,72 @@
+import asyncio
 import json
+from urllib.parse import parse_qs
 
-
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import QueryDict
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from stream_app.services import get_serialized_game
+from stream_app.outbox import Outbox
+from stream_app.services import (
+    get_board_version,
+    get_game_snapshot,
+    get_serialized_game,
+    join_game,
+    play_move,
+    submit_move,
+)
 
 
 class GameConsumer(AsyncWebsocketConsumer):
+    """
+    Sends a snapshot of the game on connect:
+    {"type": "snapshot", "seq": board version, "game": serialized game}
+    and then one delta per move:
+    {"type": "move", "seq": board version, "uci", "fen", "turn", "status"}
+    and a new snapshot for the other changes, such as a player joining or a draw
+
+    A client that sees a gap in seq sends {"resync": last seq} to get a new snapshot
+
+    Players, authenticated by their session or by a JWT in the query string
+    (see stream_app.middleware), send moves as {"move": "e2e4", "client_id": any}, and get back
+    {"type": "ack", "client_id", "ok": true, "seq"} or {"type": "ack", "client_id", "ok": false, "detail"}
+    before the delta of their move
+
+    Group events wait in an Outbox. Spectators only get the latest one, with the number
+    of events it replaced as "skipped", and GAME_COALESCE_WINDOW seconds of events
+    are collapsed into one frame. Players get every event, and are disconnected if
+    GAME_OUTBOX_SIZE of them are waiting, to reconnect from a snapshot
+    """
+
     async def connect(self):
         self.uuid = self.scope["url_route"]["kwargs"]["uuid"]
         self.game_group_name = f"game_{self.uuid}"
+        self.outbox = Outbox(settings.GAME_OUTBOX_SIZE, latest_only=True)
+        self.sender = None
 
         # Join room group
         await self.channel_layer.group_add(self.game_group_name, self.channel_name)
 
         await self.accept()
+        await self.send_snapshot()
+
+        self.sender = asyncio.ensure_future(self.send_frames())
 
     async def receive(self, text_data):
         data_json = json.loads(text_data)
 
+        if "resync" in data_json:
+            await self.send_snapshot()
+
+        if "move" in data_json:
+            await self.move(data_json.get("move"), data_json.get("client_id"))
+
         if "update" in data_json:
             game = await get_serialized_game(data_json.get("uuid"))
 
@@ -28,10 +76,300 @@ class GameConsumer(AsyncWebsocketConsumer):
             )
 
     async def game_data(self, data):
+        # Send game over WebSocket
+        await self.queue_frame(data["game"])
+
+    async def game_move(self, data):
+        await self.queue_frame(data["move"])
+
+    async def game_snapshot(self, data):
         game = data["game"]
+        # Players may have joined
+        self.outbox.latest_only = not self.is_player(game)
 
-        # Send game over WebSocket
-        await self.send(text_data=json.dumps(game))
+        await self.queue_frame(self.snapshot_frame(game))
+
+    async def queue_frame(self, frame):
+        if not self.outbox.put(frame):
+            await self.close()
+
+    async def send_frames(self):
+        while True:
+            await self.outbox.wait()
+
+            if self.outbox.latest_only and settings.GAME_COALESCE_WINDOW:
+                await asyncio.sleep(settings.GAME_COALESCE_WINDOW)
+
+            for frame in self.outbox.pop_all():
+                await self.send(text_data=json.dumps(frame))
+
+    async def move(self, uci, client_id):
+        seq, detail = await submit_move(self.uuid, self.scope.get("user"), uci)
+        ack = {"type": "ack", "client_id": client_id, "ok": seq is not None}
+
+        if seq is None:
+            ack["detail"] = detail
+
+        else:
+            ack["seq"] = seq
+
+        await self.send(text_data=json.dumps(ack))
+
+    async def send_snapshot(self):
+        game = await get_game_snapshot(self.uuid)
+
+        if game is not None:
+            # Players may have joined since the last snapshot
+            self.outbox.latest_only = not self.is_player(game)
+
+            await self.send(text_data=json.dumps(self.snapshot_frame(game)))
+
+    def snapshot_frame(self, game):
+        return {"type": "snapshot", "seq": game["board"]["version"], "game": game}
+
+    def is_player(self, game):
+        user = self.scope.get("user")
+
+        if user is None or not user.is_authenticated:
+            return False
+
+        return user.get_username() in (
+            (game.get(color) or {}).get("username")
+            for color in ("white_player", "black_player")
+        )
 
     async def disconnect(self, *args, **kwargs):
+        if self.sender is not None:
+            self.sender.cancel()
+
         await self.channel_layer.group_discard(self.game_group_name, self.channel_name)
+
+
+class ApiConsumer(AsyncHttpConsumer):
+    """
+    Base for the endpoints of the REST API served by ASGI consumers rather than by
+    GameViewSet. They answer like the view would, with JWT authentication.
+    Requests authenticated otherwise are routed to the view (see JWTRouter)
+    """
+
+    async def authenticate(self):
+        """
+        Returns: the user of the request's JWT, AnonymousUser if there is none
+        Raises: AuthenticationFailed if the token is not valid
+        """
+
+        authentication = JWTAuthentication()
+        header = dict(self.scope["headers"]).get(b"authorization")
+        raw_token = authentication.get_raw_token(header) if header else None
+
+        if raw_token is None:
+            return AnonymousUser()
+
+        validated_token = authentication.get_validated_token(raw_token)
+
+        return await database_sync_to_async(authentication.get_user)(validated_token)
+
+    def parse_body(self, body):
+        """
+        Returns: the data of a JSON or form encoded body
+        """
+
+        content_type = dict(self.scope["headers"]).get(b"content-type", b"")
+
+        if content_type.startswith(b"application/json"):
+            return json.loads(body or b"{}")
+
+        return QueryDict(body)
+
+    async def send_json(self, data, status=200, headers=None):
+        await self.send_response(
+            status,
+            json.dumps(data).encode(),
+            headers=[(b"Content-Type", b"application/json")]
+            + self.cors_headers()
+            + (headers or []),
+        )
+
+    def cors_headers(self):
+        """
+        What django-cors-headers adds to the responses of Django views
+        """
+
+        origin = dict(self.scope["headers"]).get(b"origin", b"")
+
+        if origin.decode() not in settings.CORS_ORIGIN_WHITELIST:
+            return []
+
+        headers = [(b"Access-Control-Allow-Origin", origin), (b"Vary", b"Origin")]
+
+        if settings.CORS_ALLOW_CREDENTIALS:
+            headers.append((b"Access-Control-Allow-Credentials", b"true"))
+
+        if settings.CORS_EXPOSE_HEADERS:
+            headers.append(
+                (
+                    b"Access-Control-Expose-Headers",
+                    ", ".join(settings.CORS_EXPOSE_HEADERS).encode(),
+                )
+            )
+
+        return headers
+
+
+class GameRetrieveConsumer(ApiConsumer):
+    """
+    GET /api/game/{uuid}/, as GameViewSet.retrieve, from the serialized game cache
+    """
+
+    async def handle(self, body):
+        uuid = self.scope["url_route"]["kwargs"]["uuid"]
+        version = await get_board_version(uuid)
+
+        if version is None:
+            return await self.send_json({"detail": "Not found."}, status=404)
+
+        etag = quote_etag(str(version))
+        headers = dict(self.scope["headers"])
+        if_none_match = parse_etags(headers.get(b"if-none-match", b"").decode())
+
+        if etag in if_none_match or "*" in if_none_match:
+            return await self.send_response(
+                304, b"", headers=[(b"ETag", etag.encode())] + self.cors_headers()
+            )
+
+        game = await get_serialized_game(uuid, version)
+        etag = quote_etag(str(game["board"]["version"]))
+
+        await self.send_json(game, headers=[(b"ETag", etag.encode())])
+
+
+class GameMoveConsumer(ApiConsumer):
+    """
+    PUT /api/game/{uuid}/move/ {"from_square", "to_square"}, as GameViewSet.move
+    """
+
+    async def handle(self, body):
+        uuid = self.scope["url_route"]["kwargs"]["uuid"]
+
+        try:
+            user = await self.authenticate()
+
+        except AuthenticationFailed as exc:
+            return await self.send_json({"detail": exc.detail}, status=401)
+
+        data = self.parse_body(body)
+        game, error = await database_sync_to_async(play_move)(
+            uuid, user, data.get("from_square"), data.get("to_square")
+        )
+
+        if error:
+            status, detail = error
+
+            return await self.send_json({"detail": detail}, status=status)
+
+        await self.send_json(await get_serialized_game(uuid, game.board.version))
+
+
+class GameJoinConsumer(ApiConsumer):
+    """
+    PUT /api/game/{uuid}/join/ {"preferred_color"}, as GameViewSet.join
+    """
+
+    async def handle(self, body):
+        uuid = self.scope["url_route"]["kwargs"]["uuid"]
+
+        try:
+            user = await self.authenticate()
+
+        except AuthenticationFailed as exc:
+            return await self.send_json({"detail": exc.detail}, status=401)
+
+        if not user.is_authenticated:
+            return await self.send_json(
+                {"detail": "Authentication credentials were not provided."}, status=401,
+            )
+
+        preferred_color = self.parse_body(body).get("preferred_color")
+
+        version = await join_game(uuid, user, preferred_color)
+
+        if version is None:
+            return await self.send_json({"detail": "Not found."}, status=404)
+
+        # Not a load started before the join
+        await self.send_json(await get_serialized_game(uuid, version))
+
+
+class GameWaitConsumer(ApiConsumer):
+    """
+    Long polling for clients that can't use WebSockets:
+    GET /api/game/{uuid}/wait/?after_version=N
+
+    Responds with the game as soon as its board version is greater than N,
+    or with 204 No Content after LONG_POLL_TIMEOUT seconds.
+    Waits for the events sent to GameConsumer, not on the database
+    """
+
+    async def handle(self, body):
+        self.uuid = self.scope["url_route"]["kwargs"]["uuid"]
+        self.game_group_name = f"game_{self.uuid}"
+
+        query = parse_qs(self.scope["query_string"].decode())
+
+        try:
+            after_version = int(query["after_version"][0])
+
+        except (KeyError, ValueError):
+            return await self.send_json(
+                {"detail": "after_version must be an integer."}, status=400
+            )
+
+        # Subscribe before reading the version, so that a move made in between is not missed
+        channel_name = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.game_group_name, channel_name)
+
+        try:
+            version = await get_board_version(self.uuid)
+
+            if version is None:
+                return await self.send_json({"detail": "Not found."}, status=404)
+
+            if version > after_version:
+                game = await get_serialized_game(self.uuid, version)
+
+            else:
+                game = await self.wait_for_game(channel_name, after_version)
+
+        finally:
+            await self.channel_layer.group_discard(self.game_group_name, channel_name)
+
+        if game is None:
+            return await self.send_response(204, b"", headers=self.cors_headers())
+
+        await self.send_json(game)
+
+    async def wait_for_game(self, channel_name, after_version):
+        """
+        Returns: the first game sent to the group with a board version greater than
+        after_version, or None if there was none before the timeout
+        """
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + settings.LONG_POLL_TIMEOUT
+
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    self.channel_layer.receive(channel_name), deadline - loop.time(),
+                )
+
+            except asyncio.TimeoutError:
+                return None
+
+            if message.get("type") == "game_move":
+                if message["move"]["seq"] > after_version:
+                    return await get_serialized_game(self.uuid, message["move"]["seq"])
+
+            elif message.get("type") in ("game_data", "game_snapshot"):
+                if message["game"]["board"]["version"] > after_version:
+                    return message["game"]
@@ -0,0 +1,38 @@
+"""
+Thread pool running the database work of the ASGI consumers
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+class DatabaseExecutor:
+    """
+    Makes a pool of DATABASE_EXECUTOR_WORKERS threads the default executor of the
+    event loop serving application, so a burst of requests can't open more database
+    connections than that
+
+    channels.db.database_sync_to_async runs in the default executor, and through
+    asgiref, so async_to_sync in those threads runs on this loop rather than a new one
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.loops = weakref.WeakSet()
+
+    def __call__(self, scope):
+        loop = asyncio.get_event_loop()
+
+        if loop not in self.loops:
+            loop.set_default_executor(
+                ThreadPoolExecutor(
+                    max_workers=settings.DATABASE_EXECUTOR_WORKERS,
+                    thread_name_prefix="database",
+                )
+            )
+            self.loops.add(loop)
+
+        return self.application(scope)
@@ -0,0 +1,74 @@
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack, UserLazyObject
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.security.websocket import OriginValidator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http.request import validate_host
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class SiteOriginValidator(OriginValidator):
+    """
+    Denies the WebSocket connections opened by pages that are neither served from
+    ALLOWED_HOSTS nor from the frontend, CORS_ORIGIN_WHITELIST, so other sites can't
+    send moves with a visitor's session cookie
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    @property
+    def allowed_origins(self):
+        return list(settings.ALLOWED_HOSTS) + list(settings.CORS_ORIGIN_WHITELIST)
+
+    def validate_origin(self, parsed_origin):
+        if parsed_origin is None:
+            # Only reached when ALLOWED_HOSTS has "*"
+            return True
+
+        origin = f"{parsed_origin.scheme}://{parsed_origin.netloc}"
+
+        return origin in settings.CORS_ORIGIN_WHITELIST or validate_host(
+            parsed_origin.hostname or "", settings.ALLOWED_HOSTS
+        )
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token):
+    """
+    Returns: the user of the token, AnonymousUser if it is not valid
+    """
+
+    authentication = JWTAuthentication()
+
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+
+    except AuthenticationFailed:
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates WebSocket connections with the JWT of their query string,
+    ws/game/{uuid}/?token=..., as browsers can't send an Authorization header.
+    Without a token, the user of the session is kept
+    """
+
+    def populate_scope(self, scope):
+        if "user" not in scope:
+            scope["user"] = UserLazyObject()
+
+    async def resolve_scope(self, scope):
+        token = parse_qs(scope.get("query_string", b"").decode()).get("token")
+
+        if token:
+            scope["user"]._wrapped = await get_jwt_user(token[0])
+
+
+def JWTAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
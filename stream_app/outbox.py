@@ -0,0 +1,61 @@
+"""
+Bounded queue of the frames waiting to be sent to one WebSocket client
+"""
+
+import asyncio
+from collections import deque
+
+
+class Outbox:
+    """
+    latest_only: keep only the most recent frame, and count the frames it replaced,
+    for spectators that only need the current position. Otherwise keep every frame,
+    up to maxsize, for players that need every move
+    """
+
+    def __init__(self, maxsize, latest_only=False):
+        self.maxsize = maxsize
+        self.latest_only = latest_only
+        self.skipped = 0
+        self._frames = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, frame):
+        """
+        Returns: False if the outbox is full and the frame was not queued
+        """
+
+        if self.latest_only:
+            self.skipped += len(self._frames)
+            self._frames.clear()
+
+        elif len(self._frames) >= self.maxsize:
+            return False
+
+        self._frames.append(frame)
+        self._ready.set()
+
+        return True
+
+    async def wait(self):
+        await self._ready.wait()
+
+    def pop_all(self):
+        """
+        Returns: the queued frames, oldest first. A frame that replaced others has
+        the number of frames it replaced as "skipped"
+        """
+
+        frames = list(self._frames)
+
+        if frames and self.skipped:
+            frames[-1] = {**frames[-1], "skipped": self.skipped}
+
+        self._frames.clear()
+        self._ready.clear()
+        self.skipped = 0
+
+        return frames
+
+    def __len__(self):
+        return len(self._frames)
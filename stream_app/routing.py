@@ -1,7 +1,82 @@
 from django.urls import path
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from . import consumers
 
+
+class MethodRouter:
+    """
+    Route HTTP requests on their method, and the other methods to default
+    """
+
+    def __init__(self, routes, default):
+        self.routes = routes
+        self.default = default
+
+    def __call__(self, scope):
+        return self.routes.get(scope["method"], self.default)(scope)
+
+
+class JWTRouter:
+    """
+    Route HTTP requests with a valid JWT to consumer, and the others to default, i.e. Django,
+    which authenticates them with every DRF authentication class
+    (and checks the CSRF token of session authenticated ones)
+    """
+
+    def __init__(self, consumer, default):
+        self.consumer = consumer
+        self.default = default
+
+    def __call__(self, scope):
+        if self.has_valid_token(scope):
+            return self.consumer(scope)
+
+        return self.default(scope)
+
+    def has_valid_token(self, scope):
+        authentication = JWTAuthentication()
+        header = dict(scope["headers"]).get(b"authorization")
+
+        try:
+            raw_token = authentication.get_raw_token(header) if header else None
+
+            return raw_token is not None and bool(
+                authentication.get_validated_token(raw_token)
+            )
+
+        except AuthenticationFailed:
+            # Answered by the view, as DRF words it
+            return False
+
+
 websocket_urlpatterns = [
     path(r"ws/game/<uuid>/", consumers.GameConsumer),
 ]
+
+
+def http_urlpatterns(default):
+    """
+    default: the application serving the methods the consumers don't, i.e. Django
+    """
+
+    return [
+        path(
+            "api/game/<uuid:uuid>/",
+            MethodRouter({"GET": consumers.GameRetrieveConsumer}, default),
+        ),
+        path(
+            "api/game/<uuid:uuid>/move/",
+            MethodRouter(
+                {"PUT": JWTRouter(consumers.GameMoveConsumer, default)}, default
+            ),
+        ),
+        path(
+            "api/game/<uuid:uuid>/join/",
+            MethodRouter(
+                {"PUT": JWTRouter(consumers.GameJoinConsumer, default)}, default
+            ),
+        ),
+        path("api/game/<uuid:uuid>/wait/", consumers.GameWaitConsumer),
+    ]
@@ -1,9 +1,230 @@
+import asyncio
+import logging
+
+import chess
+from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from api import serializers
+from api import services as api_services
+from api.context import GameContext
 from api.models import Game
-from api.serializers import GameSerializer
+from api.permissions import GamePermission, can_move
+
+logger = logging.getLogger(__name__)
+
+
+# Serialized games being loaded by this process, by (game uuid, version)
+_loading = {}
+
+
+async def get_serialized_game(uuid, version=None):
+    """
+    Returns: the serialized game, from the cache if it has the game at version
+    (or at its current version if version is None)
+    Raises: Game.DoesNotExist
+
+    Concurrent calls for the same game and version share a single load
+    """
+
+    key = (str(uuid), version)
+    future = _loading.get(key)
+
+    if future is None:
+        future = asyncio.ensure_future(
+            database_sync_to_async(load_serialized_game)(uuid, version)
+        )
+        _loading[key] = future
+        future.add_done_callback(lambda _: _loading.pop(key, None))
+
+    # A caller going away (e.g. a closed connection) doesn't cancel the others
+    return await asyncio.shield(future)
+
+
+def load_serialized_game(uuid, version=None):
+    """
+    Moves, players joining and draws all change Board.version (see api.services.bump_version),
+    so a cached game is never served for a version it wasn't serialized at
+    """
+
+    if version is None:
+        version = board_version(uuid)
+
+    if version is not None:
+        game = cache.get(_serialized_game_key(uuid, version))
+
+        if game is not None:
+            return game
+
+    # One query, so the board, result and players all come from the same snapshot
+    game = Game.objects.select_related(
+        "board", "result", "white_player__elo", "black_player__elo"
+    ).get(uuid=uuid)
+    game = serializers.GameSerializer(game).data
+
+    if game["board"]:
+        cache.set(
+            _serialized_game_key(uuid, game["board"]["version"]),
+            game,
+            settings.SERIALIZED_GAME_CACHE_TIMEOUT,
+        )
+
+    return game
+
+
+def _serialized_game_key(uuid, version):
+    return f"serialized_game:{uuid}:{version}"
+
+
+def board_version(uuid):
+    """
+    Returns: the Board.version of a game, or None if there is no such game
+    """
+
+    return (
+        Game.objects.filter(uuid=uuid).values_list("board__version", flat=True).first()
+    )
+
+
+get_board_version = database_sync_to_async(board_version)
+
+
+async def get_game_snapshot(uuid):
+    """
+    Returns: the serialized game, or None if there is no such game
+    """
+
+    try:
+        return await get_serialized_game(uuid)
+
+    except Game.DoesNotExist:
+        return None
+
+
+def publish_move(game, move):
+    """
+    Send a move to everyone watching its game, as a delta from the previous version:
+    the move, the new position, the side to move and the game status.
+    seq is the board version, so clients can tell when they missed a move
+
+    Called after the move is committed, so failures are logged rather than raised
+    """
+
+    board = game.board
+    delta = {
+        "type": "move",
+        "seq": board.version,
+        "uci": move.uci(),
+        "fen": board.fen,
+        "turn": "white" if board.turn else "black",
+        "status": game.result.result,
+    }
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f"game_{game.uuid}", {"type": "game_move", "move": delta},
+        )
+
+    except Exception:
+        logger.exception(
+            "Could not publish move %s of game %s", delta["uci"], game.uuid
+        )
+
+
+def publish_snapshot(game):
+    """
+    Send the whole game to everyone watching it, for the changes that are not moves,
+    such as a player joining or a draw. seq is the board version, as for moves
+
+    Called after the change is committed, so failures are logged rather than raised
+    """
+
+    try:
+        serialized_game = load_serialized_game(game.uuid)
+        async_to_sync(get_channel_layer().group_send)(
+            f"game_{game.uuid}", {"type": "game_snapshot", "game": serialized_game},
+        )
+
+    except Exception:
+        logger.exception("Could not publish a snapshot of game %s", game.uuid)
 
 
 @database_sync_to_async
-def get_serialized_game(uuid):
-    game = Game.objects.get(uuid=uuid)
-    return GameSerializer(game).data
+def submit_move(uuid, user, uci):
+    """
+    Play a move sent over the game WebSocket
+
+    Returns: (board version, None) if the move was played, (None, error message) if not
+    """
+
+    uci = uci or ""
+    game, error = play_move(uuid, user, uci[:2], uci[2:])
+
+    if error:
+        return None, error[1]
+
+    return game.board.version, None
+
+
+def play_move(uuid, user, from_square, to_square):
+    """
+    Make a move with the checks of GameViewSet.move
+
+    Returns: (game, None) if the move was played,
+    (None, (HTTP status, error message)) if not
+    """
+
+    uci = f"{from_square}{to_square}"
+
+    try:
+        requested_move = chess.Move.from_uci(uci)
+
+    except (TypeError, ValueError):
+        return None, (400, f"{uci} is not a valid move.")
+
+    game = Game.objects.select_related("board", "result").filter(uuid=uuid).first()
+
+    if game is None:
+        return None, (404, "Not found.")
+
+    if user is None or not user.is_authenticated:
+        return None, (401, "Authentication credentials were not provided.")
+
+    context = GameContext(game)
+
+    if not can_move(context, user, chess.square_name(requested_move.from_square)):
+        return None, (403, GamePermission.message)
+
+    if game.finished_at:
+        return None, (400, "The game is already over.")
+
+    move = api_services.move_piece(
+        context.board, from_square, to_square, chess_board=context.chess_board
+    )
+
+    if move is None:
+        return None, (400, f"{uci} is not a valid move.")
+
+    return game, None
+
+
+@database_sync_to_async
+def join_game(uuid, user, preferred_color):
+    """
+    GameViewSet.join
+    Returns: the board version after joining, or None if there is no such game
+    """
+
+    with transaction.atomic():
+        game = Game.objects.select_related("board").filter(uuid=uuid).first()
+
+        if game is None:
+            return None
+
+        api_services.assign_color(game, user, preferred_color=preferred_color)
+
+    return game.board.version
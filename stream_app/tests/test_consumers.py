@@ -1,16 +1,20 @@
+import asyncio
 import pytest
 import json
 
 from uuid import uuid4
-from unittest import mock
 
-from channels.testing import WebsocketCommunicator
-from stream_app.consumers import GameConsumer
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.tokens import AccessToken
+from stream_app.consumers import GameConsumer, GameWaitConsumer
 
 
-from api.models import Game
-
-from stream_app.tests.fixtures import GAME_UUID
+from api import services
+from api.models import Claim, Result
 
 
 @pytest.mark.asyncio
@@ -32,6 +36,7 @@ def game_communicator(url_route):
 
 
 @pytest.mark.asyncio
+@pytest.mark.django_db
 async def test_connect(game_communicator):
     connected, _ = await game_communicator.connect()
 
@@ -41,16 +46,17 @@ async def test_connect(game_communicator):
 
 
 @pytest.mark.asyncio
-@pytest.mark.django_db
+@pytest.mark.django_db(transaction=True)
 async def test_receive(game_communicator):
+    game = await create_game()
     connected, _ = await game_communicator.connect()
 
-    Game.objects.get = mock.MagicMock(return_value=Game(uuid=GAME_UUID))
-
-    await game_communicator.send_to(json.dumps({"update": "foo"}))
+    await game_communicator.send_to(
+        json.dumps({"update": "foo", "uuid": str(game.uuid)})
+    )
     received_message = await game_communicator.receive_json_from()
 
-    assert received_message["uuid"] == GAME_UUID
+    assert received_message["uuid"] == str(game.uuid)
 
     await game_communicator.disconnect()
 
@@ -60,3 +66,352 @@ async def test_routing():
     from stream_app import routing
 
     assert routing.websocket_urlpatterns is not None
+
+
+@database_sync_to_async
+def create_game(**players):
+    return services.create_game(result_data={}, board_data={}, **players)
+
+
+@database_sync_to_async
+def create_user(username):
+    return get_user_model().objects.create_user(username=username, password="django")
+
+
+def wait_communicator(game_uuid, query_string):
+    communicator = HttpCommunicator(
+        GameWaitConsumer, "GET", f"/api/game/{game_uuid}/wait/?{query_string}",
+    )
+    communicator.scope["query_string"] = query_string.encode()
+    communicator.scope["url_route"] = {"kwargs": {"uuid": game_uuid}}
+
+    return communicator
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_returns_newer_game():
+    game = await create_game()
+
+    response = await wait_communicator(game.uuid, "after_version=-1").get_response()
+
+    assert response["status"] == 200
+    assert json.loads(response["body"])["uuid"] == str(game.uuid)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_wakes_on_game_data():
+    game = await create_game()
+    version = game.board.version
+    communicator = wait_communicator(game.uuid, f"after_version={version}")
+    response = asyncio.ensure_future(communicator.get_response(timeout=5))
+
+    # Let the consumer subscribe to the game group
+    await asyncio.sleep(0.2)
+    assert not response.done()
+
+    await get_channel_layer().group_send(
+        f"game_{game.uuid}",
+        {"type": "game_data", "game": {"board": {"version": version}}},
+    )
+    await get_channel_layer().group_send(
+        f"game_{game.uuid}",
+        {"type": "game_data", "game": {"board": {"version": version + 1}}},
+    )
+
+    assert (await response)["status"] == 200
+    assert json.loads((await response)["body"]) == {"board": {"version": version + 1}}
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_timeout(settings):
+    settings.LONG_POLL_TIMEOUT = 0.1
+    game = await create_game()
+
+    communicator = wait_communicator(game.uuid, f"after_version={game.board.version}")
+    response = await communicator.get_response()
+
+    assert response["status"] == 204
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_not_found():
+    response = await wait_communicator(uuid4(), "after_version=0").get_response()
+
+    assert response["status"] == 404
+
+
+@pytest.mark.asyncio
+async def test_wait_requires_version():
+    response = await wait_communicator(uuid4(), "after_version=x").get_response()
+
+    assert response["status"] == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_move_is_published():
+    game = await create_game()
+    channel_layer = get_channel_layer()
+    channel_name = await channel_layer.new_channel()
+    await channel_layer.group_add(f"game_{game.uuid}", channel_name)
+
+    await database_sync_to_async(services.move_piece)(game.board, "e2", "e4")
+    message = await asyncio.wait_for(channel_layer.receive(channel_name), 1)
+
+    assert message == {
+        "type": "game_move",
+        "move": {
+            "type": "move",
+            "seq": game.board.version,
+            "uci": "e2e4",
+            "fen": "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+            "turn": "black",
+            "status": Result.IN_PROGRESS,
+        },
+    }
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_snapshot_then_deltas():
+    game = await create_game()
+    communicator = WebsocketCommunicator(GameConsumer, f"/ws/game/{game.uuid}/")
+    communicator.scope["url_route"] = {"kwargs": {"uuid": str(game.uuid)}}
+    await communicator.connect()
+
+    snapshot = await communicator.receive_json_from()
+
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["seq"] == game.board.version
+    assert snapshot["game"]["uuid"] == str(game.uuid)
+
+    await database_sync_to_async(services.move_piece)(game.board, "e2", "e4")
+    delta = await communicator.receive_json_from()
+
+    assert delta["type"] == "move"
+    assert delta["seq"] == snapshot["seq"] + 1
+    assert delta["uci"] == "e2e4"
+
+    await communicator.send_json_to({"resync": delta["seq"]})
+    resync = await communicator.receive_json_from()
+
+    assert resync["type"] == "snapshot"
+    assert resync["seq"] == delta["seq"]
+    assert resync["game"]["board"]["fen"] == delta["fen"]
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_join_and_draw_are_published():
+    white_player = await create_user("whitey_morgan")
+    black_player = await create_user("blackie_lawless")
+    game = await create_game(white_player=white_player)
+    communicator = WebsocketCommunicator(GameConsumer, f"/ws/game/{game.uuid}/")
+    communicator.scope["url_route"] = {"kwargs": {"uuid": str(game.uuid)}}
+    await communicator.connect()
+
+    snapshot = await communicator.receive_json_from()
+
+    await database_sync_to_async(services.assign_color)(game, "blackie_lawless")
+    joined = await communicator.receive_json_from()
+
+    # No gap in seq, and the new player is in the game
+    assert joined["type"] == "snapshot"
+    assert joined["seq"] == snapshot["seq"] + 1
+    assert joined["game"]["black_player"]["username"] == "blackie_lawless"
+
+    for player in (white_player, black_player):
+        await database_sync_to_async(services.claim_draw)(game, player, Claim.DRAW)
+
+    drawn = await communicator.receive_json_from()
+
+    assert drawn["type"] == "snapshot"
+    assert drawn["seq"] == joined["seq"] + 1
+    assert drawn["game"]["result"]["result"] == Result.DRAW
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_wakes_on_draw():
+    white_player = await create_user("whitey_morgan")
+    game = await create_game(white_player=white_player, black_player=white_player)
+    communicator = wait_communicator(game.uuid, f"after_version={game.board.version}")
+    response = asyncio.ensure_future(communicator.get_response(timeout=5))
+
+    await asyncio.sleep(0.2)
+    await database_sync_to_async(services.claim_draw)(game, white_player, Claim.DRAW)
+    body = json.loads((await response)["body"])
+
+    assert body["board"]["version"] == game.board.version
+    assert body["result"]["result"] == Result.DRAW
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_wait_wakes_on_move():
+    game = await create_game()
+    communicator = wait_communicator(game.uuid, f"after_version={game.board.version}")
+    response = asyncio.ensure_future(communicator.get_response(timeout=5))
+
+    await asyncio.sleep(0.2)
+    await database_sync_to_async(services.move_piece)(game.board, "e2", "e4")
+    body = json.loads((await response)["body"])
+
+    assert body["board"]["version"] == game.board.version
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_move_over_websocket():
+    white_player = await create_user("whitey_morgan")
+    black_player = await create_user("blackie_lawless")
+    game = await create_game(white_player=white_player, black_player=black_player)
+
+    communicators = {}
+
+    for user in (white_player, black_player, AnonymousUser()):
+        communicator = WebsocketCommunicator(GameConsumer, f"/ws/game/{game.uuid}/")
+        communicator.scope["url_route"] = {"kwargs": {"uuid": str(game.uuid)}}
+        communicator.scope["user"] = user
+        await communicator.connect()
+        await communicator.receive_json_from()
+        communicators[user.username] = communicator
+
+    white, black, spectator = communicators.values()
+
+    await black.send_json_to({"move": "e2e4", "client_id": 1})
+    assert await black.receive_json_from() == {
+        "type": "ack",
+        "client_id": 1,
+        "ok": False,
+        "detail": "That move is not valid or allowed",
+    }
+
+    await spectator.send_json_to({"move": "e7e5", "client_id": 2})
+    assert (await spectator.receive_json_from())["ok"] is False
+
+    await white.send_json_to({"move": "e2e5", "client_id": 3})
+    assert (await white.receive_json_from())["detail"] == "e2e5 is not a valid move."
+
+    await white.send_json_to({"move": "e2e4", "client_id": 4})
+    ack = await white.receive_json_from()
+
+    assert ack == {"type": "ack", "client_id": 4, "ok": True, "seq": ack["seq"]}
+
+    for communicator in communicators.values():
+        delta = await communicator.receive_json_from()
+
+        assert delta["uci"] == "e2e4"
+        assert delta["seq"] == ack["seq"]
+
+        await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_spectators_get_latest_frame(settings):
+    settings.GAME_COALESCE_WINDOW = 0.2
+    white_player = await create_user("whitey_morgan")
+    game = await create_game(white_player=white_player)
+    communicators = []
+
+    for user in (white_player, AnonymousUser()):
+        communicator = WebsocketCommunicator(GameConsumer, f"/ws/game/{game.uuid}/")
+        communicator.scope["url_route"] = {"kwargs": {"uuid": str(game.uuid)}}
+        communicator.scope["user"] = user
+        await communicator.connect()
+        await communicator.receive_json_from()
+        communicators.append(communicator)
+
+    player, spectator = communicators
+
+    for seq in range(1, 4):
+        await get_channel_layer().group_send(
+            f"game_{game.uuid}",
+            {"type": "game_move", "move": {"type": "move", "seq": seq}},
+        )
+
+    for seq in range(1, 4):
+        assert (await player.receive_json_from())["seq"] == seq
+
+    assert await spectator.receive_json_from() == {
+        "type": "move",
+        "seq": 3,
+        "skipped": 2,
+    }
+    assert await spectator.receive_nothing(0.3)
+
+    for communicator in communicators:
+        await communicator.disconnect()
+
+
+def site_communicator(game_uuid, origin, token=None):
+    from config.routing import application
+
+    query_string = f"?token={token}" if token is not None else ""
+
+    return WebsocketCommunicator(
+        application,
+        f"/ws/game/{game_uuid}/{query_string}",
+        headers=[(b"origin", origin.encode())],
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_websocket_token_auth(settings):
+    settings.CORS_ORIGIN_WHITELIST = ["http://localhost:3000"]
+    white_player = await create_user("whitey_morgan")
+    game = await create_game(white_player=white_player)
+
+    communicator = site_communicator(
+        game.uuid, "http://localhost:3000", AccessToken.for_user(white_player)
+    )
+    connected, _ = await communicator.connect()
+
+    assert connected
+
+    assert (await communicator.receive_json_from())["type"] == "snapshot"
+
+    await communicator.send_json_to({"move": "e2e4", "client_id": 1})
+
+    assert (await communicator.receive_json_from())["ok"] is True
+
+    await communicator.disconnect()
+
+    communicator = site_communicator(game.uuid, "http://localhost:3000", "foo")
+    await communicator.connect()
+    await communicator.receive_json_from()
+    await communicator.send_json_to({"move": "e7e5", "client_id": 2})
+
+    assert (await communicator.receive_json_from())["ok"] is False
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_websocket_foreign_origin(settings):
+    settings.ALLOWED_HOSTS = ["localhost"]
+    settings.CORS_ORIGIN_WHITELIST = ["http://localhost:3000"]
+    game = await create_game()
+
+    communicator = site_communicator(game.uuid, "http://evil.com")
+    connected, _ = await communicator.connect()
+
+    assert not connected
+
+    communicator = site_communicator(game.uuid, "http://localhost")
+    connected, _ = await communicator.connect()
+
+    assert connected
+
+    await communicator.disconnect()
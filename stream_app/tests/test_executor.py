@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from stream_app.executor import DatabaseExecutor
+
+
+async def current_loop():
+    return asyncio.get_event_loop()
+
+
+@database_sync_to_async
+def database_work():
+    return threading.current_thread().name, async_to_sync(current_loop)()
+
+
+@pytest.mark.asyncio
+async def test_database_executor(settings):
+    settings.DATABASE_EXECUTOR_WORKERS = 2
+    application = DatabaseExecutor(lambda scope: scope["type"])
+
+    assert application({"type": "http"}) == "http"
+
+    thread_name, loop = await database_work()
+
+    assert thread_name.startswith("database")
+    # async_to_sync in the pool goes back to the loop serving the application
+    assert loop is asyncio.get_event_loop()
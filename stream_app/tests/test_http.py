@@ -0,0 +1,195 @@
+import asyncio
+import json
+
+import pytest
+from channels.db import database_sync_to_async
+from channels.testing import HttpCommunicator
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import services
+from stream_app import services as stream_services
+from stream_app.consumers import (
+    GameJoinConsumer,
+    GameMoveConsumer,
+    GameRetrieveConsumer,
+)
+from stream_app.routing import JWTRouter, MethodRouter
+
+
+@database_sync_to_async
+def create_user(username):
+    return get_user_model().objects.create_user(username=username, password="django")
+
+
+@database_sync_to_async
+def create_game(**players):
+    return services.create_game(result_data={}, board_data={}, **players)
+
+
+def communicator(
+    consumer, method, game_uuid, action="", data=None, user=None, headers=None
+):
+    headers = list(headers or [])
+
+    if data is not None:
+        headers.append((b"content-type", b"application/json"))
+
+    if user is not None:
+        headers.append(
+            (b"authorization", f"Bearer {AccessToken.for_user(user)}".encode())
+        )
+
+    communicator = HttpCommunicator(
+        consumer,
+        method,
+        f"/api/game/{game_uuid}/{action}",
+        body=json.dumps(data).encode() if data is not None else b"",
+        headers=headers,
+    )
+    communicator.scope["url_route"] = {"kwargs": {"uuid": game_uuid}}
+
+    return communicator
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_retrieve():
+    game = await create_game()
+
+    response = await communicator(GameRetrieveConsumer, "GET", game.uuid).get_response()
+    etag = dict(response["headers"])[b"ETag"]
+
+    assert response["status"] == 200
+    assert json.loads(response["body"])["uuid"] == str(game.uuid)
+    assert etag == f'"{game.board.version}"'.encode()
+
+    response = await communicator(
+        GameRetrieveConsumer, "GET", game.uuid, headers=[(b"if-none-match", etag)]
+    ).get_response()
+
+    assert response["status"] == 304
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_retrieve_cors(settings):
+    settings.CORS_ORIGIN_WHITELIST = ["http://localhost:3000"]
+    game = await create_game()
+
+    response = await communicator(
+        GameRetrieveConsumer,
+        "GET",
+        game.uuid,
+        headers=[(b"origin", b"http://localhost:3000")],
+    ).get_response()
+    headers = dict(response["headers"])
+
+    assert headers[b"Access-Control-Allow-Origin"] == b"http://localhost:3000"
+    # The frontend can read the ETag for its If-None-Match requests
+    assert headers[b"Access-Control-Expose-Headers"] == b"ETag"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_move():
+    white_player = await create_user("whitey_morgan")
+    black_player = await create_user("blackie_lawless")
+    game = await create_game(white_player=white_player, black_player=black_player)
+    e2e4 = {"from_square": "e2", "to_square": "e4"}
+
+    async def move(data, user=None):
+        return await communicator(
+            GameMoveConsumer, "PUT", game.uuid, "move/", data, user
+        ).get_response()
+
+    assert (await move(e2e4))["status"] == 401
+    assert (await move(e2e4, black_player))["status"] == 403
+
+    response = await move({"from_square": "e2", "to_square": "e5"}, white_player)
+
+    assert response["status"] == 400
+    assert json.loads(response["body"]) == {"detail": "e2e5 is not a valid move."}
+
+    response = await move(e2e4, white_player)
+    moved_game = json.loads(response["body"])
+
+    assert response["status"] == 200
+    assert moved_game["board"]["version"] == game.board.version + 1
+    assert moved_game["board"]["fen"].split()[1] == "b"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_join():
+    white_player = await create_user("whitey_morgan")
+    black_player = await create_user("blackie_lawless")
+    game = await create_game(white_player=white_player)
+
+    response = await communicator(
+        GameJoinConsumer, "PUT", game.uuid, "join/", {}
+    ).get_response()
+
+    assert response["status"] == 401
+
+    # A load of the current game started before the join, e.g. by a spectator
+    stale_load = asyncio.get_event_loop().create_future()
+    stale_load.set_result({"uuid": str(game.uuid)})
+    stream_services._loading[(str(game.uuid), None)] = stale_load
+
+    try:
+        response = await communicator(
+            GameJoinConsumer, "PUT", game.uuid, "join/", {}, black_player
+        ).get_response()
+
+    finally:
+        stream_services._loading.pop((str(game.uuid), None))
+
+    joined_game = json.loads(response["body"])
+
+    assert response["status"] == 200
+    assert joined_game["black_player"]["username"] == "blackie_lawless"
+    assert joined_game["board"]["version"] == game.board.version + 1
+
+
+def test_method_router():
+    router = MethodRouter({"GET": lambda scope: "consumer"}, lambda scope: "django")
+
+    assert router({"method": "GET"}) == "consumer"
+    assert router({"method": "DELETE"}) == "django"
+
+
+def test_jwt_router(settings):
+    router = JWTRouter(lambda scope: "consumer", lambda scope: "django")
+    token = AccessToken()
+
+    assert router({"headers": [(b"authorization", f"Bearer {token}".encode())]}) == (
+        "consumer"
+    )
+    # Session, token or no authentication is left to DRF
+    assert router({"headers": [(b"cookie", b"sessionid=foo")]}) == "django"
+    assert router({"headers": [(b"authorization", b"Token foo")]}) == "django"
+    assert router({"headers": []}) == "django"
+    # So are invalid tokens
+    assert router({"headers": [(b"authorization", b"Bearer foo")]}) == "django"
+    assert router({"headers": [(b"authorization", b"Bearer")]}) == "django"
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_move_in_finished_game():
+    white_player = await create_user("whitey_morgan")
+    game = await create_game(white_player=white_player, black_player=white_player)
+    await database_sync_to_async(services.finish_game)(game, "1/2-1/2")
+
+    response = await communicator(
+        GameMoveConsumer,
+        "PUT",
+        game.uuid,
+        "move/",
+        {"from_square": "e2", "to_square": "e4"},
+        white_player,
+    ).get_response()
+
+    assert response["status"] == 400
+    assert json.loads(response["body"]) == {"detail": "The game is already over."}
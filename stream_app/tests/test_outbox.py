@@ -0,0 +1,37 @@
+import pytest
+
+from stream_app.outbox import Outbox
+
+
+def test_outbox_keeps_every_frame():
+    outbox = Outbox(2)
+
+    assert outbox.put({"seq": 1})
+    assert outbox.put({"seq": 2})
+    assert not outbox.put({"seq": 3})
+    assert outbox.pop_all() == [{"seq": 1}, {"seq": 2}]
+    assert len(outbox) == 0
+
+
+def test_outbox_keeps_latest_frame():
+    outbox = Outbox(2, latest_only=True)
+
+    for seq in range(5):
+        assert outbox.put({"seq": seq})
+
+    assert outbox.pop_all() == [{"seq": 4, "skipped": 4}]
+
+    outbox.put({"seq": 5})
+
+    assert outbox.pop_all() == [{"seq": 5}]
+
+
+@pytest.mark.asyncio
+async def test_outbox_wait():
+    outbox = Outbox(2)
+    outbox.put({"seq": 1})
+
+    await outbox.wait()
+    outbox.pop_all()
+
+    assert not outbox._ready.is_set()
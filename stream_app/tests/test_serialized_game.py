@@ -0,0 +1,75 @@
+import asyncio
+import time
+from unittest import mock
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from api import services
+from api.models import Elo
+from stream_app import services as stream_services
+
+
+@pytest.mark.django_db
+def test_load_serialized_game_is_cached(django_assert_num_queries):
+    game = services.create_game(result_data={}, board_data={})
+    version = game.board.version
+
+    serialized_game = stream_services.load_serialized_game(game.uuid, version)
+
+    with django_assert_num_queries(0):
+        assert (
+            stream_services.load_serialized_game(game.uuid, version) == serialized_game
+        )
+
+    with django_assert_num_queries(1):
+        assert stream_services.load_serialized_game(game.uuid) == serialized_game
+
+    services.move_piece(game.board, "e2", "e4")
+    moved_game = stream_services.load_serialized_game(game.uuid)
+
+    assert moved_game["board"]["version"] == version + 1
+    assert moved_game["board"]["fen"] != serialized_game["board"]["fen"]
+
+
+@pytest.mark.django_db
+def test_load_serialized_game_query_count(django_assert_num_queries):
+    players = [
+        get_user_model().objects.create_user(username=username, password="django")
+        for username in ("whitey_morgan", "blackie_lawless")
+    ]
+
+    for player in players:
+        Elo.objects.create(player=player)
+
+    game = services.create_game(
+        result_data={}, board_data={}, white_player=players[0], black_player=players[1]
+    )
+
+    # The game, its board, result and both players with their Elo in one query
+    with django_assert_num_queries(1):
+        serialized_game = stream_services.load_serialized_game(
+            game.uuid, game.board.version
+        )
+
+    assert serialized_game["black_player"]["username"] == "blackie_lawless"
+
+
+@pytest.mark.asyncio
+async def test_get_serialized_game_coalesces_loads():
+    def load_serialized_game(uuid, version=None):
+        # Slow enough for every request to find the first one loading
+        time.sleep(0.1)
+
+        return {"uuid": uuid}
+
+    with mock.patch.object(
+        stream_services, "load_serialized_game", side_effect=load_serialized_game
+    ) as load:
+        games = await asyncio.gather(
+            *(stream_services.get_serialized_game("foo", 1) for _ in range(10))
+        )
+
+    assert games == [{"uuid": "foo"}] * 10
+    assert load.call_count == 1
+    assert stream_services._loading == {}